@@ -33,6 +33,9 @@ import subprocess
 import sys
 
 import fdisk_output_parser
+import metrics
+import partition_filesystem
+import qcow2_overlay
 
 
 class OperationFailedError(Exception):
@@ -45,7 +48,9 @@ class OperationFailedError(Exception):
 
 
 def detach_loopback_device(loopback_device_file):
-    subprocess.call(['losetup', '-d', loopback_device_file])
+    # A failure of cleanup is not fatal, but it leaks the loop device.
+    if subprocess.call(['losetup', '-d', loopback_device_file]) != 0:
+        metrics.count_failure(u'detach_cleanup')
 
 
 def attach_partitions(
@@ -196,8 +201,169 @@ def detect_partitons(image_file):
         raise OperationFailedError(e)
 
 
+def detect_nbd_partitions(nbd_device_file):
+    u'''
+    Detect partitions in an image that is attached to an NBD device.
+
+    Argument:
+        nbd_device_file : An NBD device file.
+    Return:
+        A list of Partition in the image.
+    Raise:
+        OperationFailedError : When detection partitions are failed.
+    '''
+    try:
+        fdisk_output = subprocess.check_output(
+            ['fdisk', '-lu', nbd_device_file], stderr=subprocess.STDOUT)
+        return fdisk_output_parser.detect_partitions(fdisk_output)
+    except subprocess.CalledProcessError, e:
+        raise OperationFailedError(e)
+    except fdisk_output_parser.ParseError, e:
+        raise OperationFailedError(e)
+
+
+def attach_nbd_partitions(
+        loop_device_file_prefix, loop_device_start_number, image_file,
+        nbd_device_file):
+    u'''
+    Attach an image to an NBD device, and attach its partitions to loop
+    devices.
+
+    Arguments:
+        loop_device_file_prefix : A prefix of loop device file.
+        loop_device_start_number : Start number of loop device.
+        image_file : A raw image or a qcow2 overlay.
+        nbd_device_file : An NBD device file.
+    Return:
+        A dictionary that maps loop device to attached partition.
+    Raise:
+        OperationFailedError : When attaching partitions are failed.
+    '''
+    try:
+        qcow2_overlay.connect_nbd_device(nbd_device_file, image_file)
+    except subprocess.CalledProcessError, e:
+        raise OperationFailedError(e)
+
+    try:
+        with metrics.phase(u'detect'):
+            partitions = detect_nbd_partitions(nbd_device_file)
+        with metrics.phase(u'attach'):
+            return attach_partitions(
+                partitions, loop_device_file_prefix,
+                loop_device_start_number, nbd_device_file)
+    except OperationFailedError:
+        if qcow2_overlay.disconnect_nbd_device(nbd_device_file) != 0:
+            metrics.count_failure(u'detach_cleanup')
+        raise
+
+
+def detach_nbd_partitions(
+        loop_device_file_prefix, loop_device_start_number, nbd_device_file):
+    u'''
+    Detach partitions of an image in an NBD device, and detach the image
+    from the NBD device.
+
+    Arguments:
+        loop_device_file_prefix : A prefix of loop device file.
+        loop_device_start_number : Start number of loop device.
+        nbd_device_file : An NBD device file.
+    Return:
+        A list of detached loop device files.
+    Raise:
+        OperationFailedError : When detaching partitions are failed.
+    '''
+    # Disconnect the NBD device even if detecting partitions or detaching
+    # loop devices is failed, so that the NBD device is not leaked.
+    is_detached = False
+    try:
+        with metrics.phase(u'detect'):
+            partitions = detect_nbd_partitions(nbd_device_file)
+
+        with metrics.phase(u'detach'):
+            detached_loop_device_files = detach_partitions(
+                len(partitions), loop_device_file_prefix,
+                loop_device_start_number)
+        is_detached = True
+    finally:
+        disconnect_status = qcow2_overlay.disconnect_nbd_device(
+            nbd_device_file)
+        if disconnect_status != 0 and not is_detached:
+            metrics.count_failure(u'detach_cleanup')
+
+    if disconnect_status != 0:
+        raise OperationFailedError(
+            u'Cannot disconnect the NBD device : ' + nbd_device_file)
+
+    return detached_loop_device_files
+
+
+def detect_image_partitions(image_file):
+    u'''
+    Detect partitions in the image file without loop devices.
+
+    fdisk reads the image file directly. Logical partitions are contained.
+
+    Argument:
+        image_file : An image file.
+    Return:
+        A list of Partition in the image file.
+    Raise:
+        OperationFailedError : When detection partitions are failed.
+    '''
+    try:
+        return fdisk_output_parser.read_partitions(image_file)
+    except subprocess.CalledProcessError, e:
+        raise OperationFailedError(e)
+    except (OSError, fdisk_output_parser.ParseError), e:
+        raise OperationFailedError(e)
+
+
+def attach_partitions_with_fuse(
+        partitions, mount_point, image_file, read_only=False):
+    u'''
+    Expose partitions in an image file as files p1, p2, ... in a mount point.
+
+    This function returns when the mount point is unmounted.
+
+    Arguments:
+        partitions : A list of attaching Partitions.
+        mount_point : A mount point of FUSE.
+        image_file : An image file that contains the partitions.
+        read_only : True if the partitions are not written.
+    Raise:
+        OperationFailedError : When mounting is failed.
+    '''
+    for name, partition in partition_filesystem.list_partition_files(
+            partitions):
+        print '%s, %s' % (os.path.join(mount_point, name), partition.system)
+    sys.stdout.flush()
+
+    try:
+        partition_filesystem.mount(
+            image_file, partitions, mount_point, read_only)
+    except (ImportError, RuntimeError), e:
+        raise OperationFailedError(e)
+
+
+def detach_partitions_with_fuse(mount_point):
+    u'''
+    Unmount a mount point of FUSE.
+
+    Argument:
+        mount_point : A mount point of FUSE.
+    Raise:
+        OperationFailedError : When unmounting is failed.
+    '''
+    try:
+        subprocess.check_output(
+            ['fusermount', '-u', mount_point], stderr=subprocess.STDOUT)
+    except subprocess.CalledProcessError, e:
+        raise OperationFailedError(e)
+
+
 def main(loop_device_file_prefix, loop_device_start_number, is_attach,
-         image_file):
+         image_file, fuse_mount_point=None, nbd_device_file=None,
+         is_read_only=False):
     # Check the image file is available.
     # If it is not available, exit with help message.
 
@@ -205,22 +371,50 @@ def main(loop_device_file_prefix, loop_device_start_number, is_attach,
         print >>sys.stderr, u'Image file is not found : ' + image_file
         sys.exit(1)
 
+    # With FUSE, partitions are exposed as files instead of loop devices.
+
+    if fuse_mount_point:
+        if is_attach:
+            attach_partitions_with_fuse(
+                detect_image_partitions(image_file), fuse_mount_point,
+                image_file, is_read_only)
+        else:
+            detach_partitions_with_fuse(fuse_mount_point)
+        return
+
+    # With NBD, the image is attached to the NBD device at first.
+
+    if nbd_device_file:
+        if is_attach:
+            print_attaching_result(attach_nbd_partitions(
+                loop_device_file_prefix, loop_device_start_number,
+                image_file, nbd_device_file))
+        else:
+            print_detaching_result(detach_nbd_partitions(
+                loop_device_file_prefix, loop_device_start_number,
+                nbd_device_file))
+        return
+
     # Detect partitions in the image file.
 
-    partitions = detect_partitons(image_file)
+    with metrics.phase(u'detect'):
+        partitions = detect_partitons(image_file)
 
     # If attach is requested, attach partitions.
     # If detach is requested, detach partitions.
     # And print result.
 
     if is_attach:
-        result = attach_partitions(
-            partitions, loop_device_file_prefix, loop_device_start_number,
-            image_file)
+        with metrics.phase(u'attach'):
+            result = attach_partitions(
+                partitions, loop_device_file_prefix,
+                loop_device_start_number, image_file)
         print_attaching_result(result)
     else:
-        result = detach_partitions(
-            len(partitions), loop_device_file_prefix, loop_device_start_number)
+        with metrics.phase(u'detach'):
+            result = detach_partitions(
+                len(partitions), loop_device_file_prefix,
+                loop_device_start_number)
         print_detaching_result(result)
 
 
@@ -237,6 +431,24 @@ def create_command_line_parser():
     parser.add_argument(
         '-d', '--detach', dest='is_attach', action='store_false',
         default=True, help=u'Detach partitions.')
+    parser.add_argument(
+        '-f', '--fuse', dest='fuse_mount_point', default=None,
+        metavar='MOUNT_POINT',
+        help=u'Expose partitions as files in the mount point with FUSE ' +
+        u'instead of loop devices. Attaching runs until detached.')
+    parser.add_argument(
+        '-r', '--read-only', dest='is_read_only', action='store_true',
+        default=False,
+        help=u'Expose partitions as read-only files with FUSE.')
+    parser.add_argument(
+        '-n', '--nbd', dest='nbd_device_file', default=None,
+        metavar='NBD_DEVICE',
+        help=u'Attach the image to the NBD device with qemu-nbd before ' +
+        u'attaching partitions. The image may be a qcow2 overlay.')
+    parser.add_argument(
+        '--metrics', dest='metrics_textfile', default=None,
+        metavar='TEXTFILE',
+        help=u'Textfile of the Prometheus node exporter to record metrics.')
     parser.add_argument(
         'image_file', metavar='IMAGE_FILE', nargs='?',
         help="Path of an image file.")
@@ -254,12 +466,16 @@ if __name__ == '__main__':
     # If image file is not available, exit with help message.
 
     if arguments.image_file:
+        metrics.configure(arguments.metrics_textfile, u'attach')
         try:
             main(
                 arguments.loop_device_files_prefix,
                 arguments.loop_device_start_number,
                 arguments.is_attach,
-                arguments.image_file)
+                arguments.image_file,
+                arguments.fuse_mount_point,
+                arguments.nbd_device_file,
+                arguments.is_read_only)
         except OperationFailedError, e:
             causeException = e.cause
             if isinstance(causeException, subprocess.CalledProcessError):
@@ -267,6 +483,8 @@ if __name__ == '__main__':
             else:
                 print >>sys.stderr, causeException
             sys.exit(1)
+        finally:
+            metrics.write()
     else:
         parser.print_help()
         sys.exit(1)
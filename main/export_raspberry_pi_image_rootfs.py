@@ -0,0 +1,559 @@
+#!/usr/bin/env python
+
+# The MIT License (MIT)
+#
+# Copyright (c) 2013 Keita Kita
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in
+# all copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN
+# THE SOFTWARE.
+
+
+# export_raspberry_pi_image_rootfs
+#
+# A script that exports the root filesystem in an image of Raspberry Pi to
+# a squashfs image or a compressed tarball.
+#
+# Walking the tree is left to mksquashfs or tar, and compression runs on
+# multiple threads.
+
+import argparse
+import multiprocessing
+import os
+import os.path
+import stat
+import subprocess
+import sys
+import tempfile
+import time
+
+import fdisk_output_parser
+import mount_raspberry_pi_image_rootfs
+
+
+class ExportFailedError(Exception):
+    def __init__(self, message, cause=None):
+        Exception.__init__(self, message)
+        self.__cause = cause
+
+    @property
+    def cause(self):
+        return self.__cause
+
+
+# Formats of exported files.
+
+SQUASHFS_FORMAT = u'squashfs'
+
+TAR_ZSTD_FORMAT = u'tar.zst'
+
+TAR_XZ_FORMAT = u'tar.xz'
+
+TAR_GZIP_FORMAT = u'tar.gz'
+
+FORMATS = [SQUASHFS_FORMAT, TAR_ZSTD_FORMAT, TAR_XZ_FORMAT, TAR_GZIP_FORMAT]
+
+FORMAT_EXTENSIONS = [
+    (u'.squashfs', SQUASHFS_FORMAT),
+    (u'.sqfs', SQUASHFS_FORMAT),
+    (u'.tar.zst', TAR_ZSTD_FORMAT),
+    (u'.tzst', TAR_ZSTD_FORMAT),
+    (u'.tar.xz', TAR_XZ_FORMAT),
+    (u'.txz', TAR_XZ_FORMAT),
+    (u'.tar.gz', TAR_GZIP_FORMAT),
+    (u'.tgz', TAR_GZIP_FORMAT)]
+
+BYTES_PAR_MIB = 1024.0 ** 2
+
+PROC_MOUNTS_FILE = u'/proc/mounts'
+
+SYSFS_BLOCK_DIRECTORY = u'/sys/block'
+
+
+def detect_export_format(output_file):
+    u'''
+    Detect the format of an exported file from its extension.
+
+    Argument:
+        output_file : A path of the exported file.
+    Return:
+        A format. If the extension is unknown, None is returned.
+    '''
+    for extension, export_format in FORMAT_EXTENSIONS:
+        if output_file.endswith(extension):
+            return export_format
+    else:
+        return None
+
+
+def create_export_commands(export_format, source_directory, threads_count):
+    u'''
+    Create commands that write an exported file to the standard output.
+
+    Ownership, extended attributes and device nodes are preserved.
+
+    Arguments:
+        export_format : A format of the exported file.
+        source_directory : A directory of the root filesystem.
+        threads_count : A count of threads of compression.
+    Return:
+        A list of commands. The commands are connected by pipes.
+        If the list is empty, the format writes the output file itself.
+    '''
+    if export_format == SQUASHFS_FORMAT:
+        return []
+
+    tar_command = [
+        'tar', '--create', '--file=-', '--numeric-owner', '--xattrs',
+        '--xattrs-include=*', '--acls', '--sparse', '--one-file-system',
+        '--directory', source_directory, '.']
+
+    if export_format == TAR_ZSTD_FORMAT:
+        compress_command = ['zstd', '-q', '-c', '-T%d' % threads_count]
+    elif export_format == TAR_XZ_FORMAT:
+        compress_command = ['xz', '-c', '-T%d' % threads_count]
+    elif export_format == TAR_GZIP_FORMAT:
+        compress_command = ['pigz', '-c', '-p', str(threads_count)]
+    else:
+        raise ValueError(export_format)
+
+    return [tar_command, compress_command]
+
+
+def create_squashfs_command(source_directory, output_file, threads_count):
+    u'''
+    Create a command that writes a squashfs image.
+
+    Arguments:
+        source_directory : A directory of the root filesystem.
+        output_file : A path of the squashfs image.
+        threads_count : A count of threads of compression.
+    Return:
+        A command.
+    '''
+    return [
+        'mksquashfs', source_directory, output_file, '-noappend',
+        '-one-file-system', '-processors', str(threads_count)]
+
+
+def format_throughput(input_bytes, output_bytes, seconds):
+    u'''
+    Format the throughput of exporting.
+
+    Arguments:
+        input_bytes : Bytes used in the root filesystem.
+        output_bytes : Bytes of the exported file.
+        seconds : Elapsed seconds.
+    Return:
+        A string of the throughput.
+    '''
+    input_mib = input_bytes / BYTES_PAR_MIB
+    output_mib = output_bytes / BYTES_PAR_MIB
+    if seconds > 0:
+        throughput = input_mib / seconds
+    else:
+        throughput = 0.0
+
+    return u'%.1f MiB -> %.1f MiB in %.1f s (%.1f MiB/s)' % (
+        input_mib, output_mib, seconds, throughput)
+
+
+def get_used_bytes(directory):
+    u'''
+    Get bytes used in the filesystem of the directory.
+
+    Argument:
+        directory : A directory in the filesystem.
+    Return:
+        Used bytes.
+    '''
+    filesystem_status = os.statvfs(directory)
+    return (filesystem_status.f_blocks - filesystem_status.f_bfree) * \
+        filesystem_status.f_frsize
+
+
+def remove_output_file(output_file):
+    u'''
+    Remove a partial output file. A missing file is ignored.
+
+    Argument:
+        output_file : A path of the exported file.
+    '''
+    try:
+        os.remove(output_file)
+    except OSError:
+        pass
+
+
+def stop_process(process):
+    u'''
+    Kill a process and wait for it.
+
+    Argument:
+        process : A Popen object.
+    '''
+    try:
+        process.kill()
+    except OSError:
+        # The process has already exited.
+        pass
+    process.wait()
+
+
+def pipe_commands(tar_command, compress_command, output):
+    u'''
+    Pipe tar to the compressor and write the compressed data to the output.
+
+    Arguments:
+        tar_command : A command of tar.
+        compress_command : A command of the compressor.
+        output : A file object of the exported file.
+    Raise:
+        ExportFailedError : When a command cannot be started or fails.
+    '''
+    try:
+        tar_process = subprocess.Popen(tar_command, stdout=subprocess.PIPE)
+    except OSError, e:
+        raise ExportFailedError(u'tar cannot be started.', e)
+
+    try:
+        compress_process = subprocess.Popen(
+            compress_command, stdin=tar_process.stdout, stdout=output)
+    except OSError, e:
+        stop_process(tar_process)
+        raise ExportFailedError(
+            u'%s cannot be started.' % compress_command[0], e)
+    finally:
+        # Close the pipe in this process so that tar stops when
+        # the compressor exits.
+        tar_process.stdout.close()
+
+    # Check the compressor first. If it failed, tar may be blocked
+    # or be writing to a closed pipe.
+
+    compress_status = compress_process.wait()
+    if compress_status != 0:
+        stop_process(tar_process)
+        raise ExportFailedError(
+            u'%s failed with status %d.' % (
+                compress_command[0], compress_status))
+
+    tar_status = tar_process.wait()
+    if tar_status != 0:
+        raise ExportFailedError(u'tar failed with status %d.' % tar_status)
+
+
+def export_directory(
+        export_format, source_directory, output_file, threads_count):
+    u'''
+    Export the directory to the output file.
+
+    The partial output file is removed when exporting is failed.
+
+    Arguments:
+        export_format : A format of the exported file.
+        source_directory : A directory of the root filesystem.
+        output_file : A path of the exported file.
+        threads_count : A count of threads of compression.
+    Raise:
+        ExportFailedError : When exporting is failed.
+    '''
+    if export_format == SQUASHFS_FORMAT:
+        try:
+            subprocess.check_call(create_squashfs_command(
+                source_directory, output_file, threads_count))
+        except (subprocess.CalledProcessError, OSError), e:
+            remove_output_file(output_file)
+            raise ExportFailedError(u'mksquashfs failed.', e)
+        return
+
+    (tar_command, compress_command) = create_export_commands(
+        export_format, source_directory, threads_count)
+
+    try:
+        output = open(output_file, 'wb')
+    except IOError, e:
+        raise ExportFailedError(u'Cannot open the output file.', e)
+
+    is_exported = False
+    try:
+        with output:
+            pipe_commands(tar_command, compress_command, output)
+        is_exported = True
+    finally:
+        if not is_exported:
+            remove_output_file(output_file)
+
+
+def detect_filesystem_offset(device_file):
+    u'''
+    Detect offset bytes of the root filesystem in a device.
+
+    A device without a partition table, such as a partition attached by
+    attach_image_partitions, is the root filesystem itself.
+
+    Argument:
+        device_file : A device file that an image or a partition is attached.
+    Return:
+        Offset bytes of the root filesystem.
+    Raise:
+        ExportFailedError : When the offset cannot be detected.
+    '''
+    try:
+        fdisk_output = subprocess.check_output(
+            ['fdisk', '-lu', device_file], stderr=subprocess.STDOUT)
+    except subprocess.CalledProcessError, e:
+        raise ExportFailedError(u'Cannot get partitions of the device.', e)
+
+    try:
+        partitions = fdisk_output_parser.detect_partitions(fdisk_output)
+    except fdisk_output_parser.ParseError:
+        return 0
+    if not partitions:
+        return 0
+
+    try:
+        return mount_raspberry_pi_image_rootfs.\
+            detect_root_filesystem_offset(fdisk_output)
+    except mount_raspberry_pi_image_rootfs.CannotDetectOffsetError:
+        raise ExportFailedError(
+            u'The offset of the root filesystem cannot be detected.')
+
+
+def parse_mounts(mounts):
+    u'''
+    Parse a content of /proc/mounts.
+
+    Argument:
+        mounts : A string of the content of /proc/mounts.
+    Return:
+        A list of tuples of a source and a mount point.
+    '''
+    parsed_mounts = []
+    for line in mounts.splitlines():
+        fields = line.split()
+        if len(fields) < 2:
+            continue
+
+        # Spaces and so on are escaped in octal.
+        parsed_mounts.append(tuple(
+            field.decode('string_escape') for field in fields[:2]))
+
+    return parsed_mounts
+
+
+def is_loop_device_over(
+        loop_device_file, device_file, offset,
+        sysfs_block_directory=SYSFS_BLOCK_DIRECTORY):
+    u'''
+    Check that a loop device is attached to a device at the offset.
+
+    Arguments:
+        loop_device_file : A loop device file.
+        device_file : A device file that may back the loop device.
+        offset : Offset bytes in the device. If it is None, any offset
+                 matches.
+        sysfs_block_directory : A directory of block devices in sysfs.
+    Return:
+        True if the loop device is attached to the device at the offset.
+    '''
+    loop_directory = os.path.join(
+        sysfs_block_directory, os.path.basename(loop_device_file), u'loop')
+    try:
+        with open(os.path.join(loop_directory, u'backing_file')) as f:
+            backing_file = f.read().strip()
+        with open(os.path.join(loop_directory, u'offset')) as f:
+            loop_offset = int(f.read().strip())
+    except (IOError, ValueError):
+        return False
+
+    return os.path.realpath(backing_file) == os.path.realpath(device_file) \
+        and (offset is None or loop_offset == offset)
+
+
+def find_mount_point(
+        device_file, offset, mounts_file=PROC_MOUNTS_FILE,
+        sysfs_block_directory=SYSFS_BLOCK_DIRECTORY):
+    u'''
+    Find a mount point of the root filesystem in a device.
+
+    The root filesystem is mounted from the device itself, or from a loop
+    device at the offset in the device as mount_raspberry_pi_image_rootfs
+    does.
+
+    Arguments:
+        device_file : A device file that an image or a partition is attached.
+        offset : Offset bytes of the root filesystem.
+        mounts_file : A path of /proc/mounts.
+        sysfs_block_directory : A directory of block devices in sysfs.
+    Return:
+        A mount point. If the root filesystem is not mounted, None is
+        returned.
+    '''
+    with open(mounts_file) as f:
+        mounts = parse_mounts(f.read())
+
+    for source, mount_point in mounts:
+        if offset == 0 and \
+                os.path.realpath(source) == os.path.realpath(device_file):
+            return mount_point
+        if is_loop_device_over(
+                source, device_file, offset, sysfs_block_directory):
+            return mount_point
+    else:
+        return None
+
+
+def mount_loopback_device(device_file, offset):
+    u'''
+    Mount the root filesystem in an attached device as read only.
+
+    Arguments:
+        device_file : A device file that an image or a partition is attached.
+        offset : Offset bytes of the root filesystem.
+    Return:
+        A temporary mount point.
+    Raise:
+        ExportFailedError : When mounting is failed.
+    '''
+    if offset == 0:
+        options = 'ro'
+    else:
+        options = 'ro,loop,offset=%d' % offset
+
+    mount_point = tempfile.mkdtemp(prefix='rootfs-export-')
+    try:
+        subprocess.check_output(
+            ['mount', '-o', options, device_file, mount_point],
+            stderr=subprocess.STDOUT)
+    except subprocess.CalledProcessError, e:
+        os.rmdir(mount_point)
+        raise ExportFailedError(u'Cannot mount the root filesystem.', e)
+
+    return mount_point
+
+
+def unmount_temporary_mount_point(mount_point):
+    subprocess.call(['umount', mount_point], stderr=subprocess.STDOUT)
+    os.rmdir(mount_point)
+
+
+def main(source, output_file, export_format, threads_count):
+    # Check the source exists.
+    # If it does not exist, print an error message and exit.
+
+    if not os.path.exists(source):
+        print >>sys.stderr, "Source does not exist : " + source
+        sys.exit(1)
+
+    if export_format is None:
+        export_format = detect_export_format(output_file)
+        if export_format is None:
+            print >>sys.stderr, \
+                "Format cannot be detected from the output file : " + \
+                output_file
+            sys.exit(1)
+
+    is_loopback_device = stat.S_ISBLK(os.stat(source).st_mode)
+    is_temporary_mount_point = False
+
+    try:
+        # If a loop device is specified, use the mount point of its root
+        # filesystem. If it is not mounted, mount it temporarily.
+
+        if is_loopback_device:
+            offset = detect_filesystem_offset(source)
+            source_directory = find_mount_point(source, offset)
+
+            if source_directory is None:
+                print '--- Mount the root filesystem in %s ---' % source
+
+                source_directory = mount_loopback_device(source, offset)
+                is_temporary_mount_point = True
+        else:
+            source_directory = source
+
+        # Export the root filesystem.
+
+        print '--- Export %s to %s ---' % (source_directory, output_file)
+
+        try:
+            used_bytes = get_used_bytes(source_directory)
+            start_time = time.time()
+
+            export_directory(
+                export_format, source_directory, output_file, threads_count)
+
+            elapsed_seconds = time.time() - start_time
+        finally:
+            if is_temporary_mount_point:
+                unmount_temporary_mount_point(source_directory)
+    except ExportFailedError, e:
+        print >>sys.stderr, e
+        if isinstance(e.cause, subprocess.CalledProcessError) and \
+                e.cause.output:
+            print >>sys.stderr, e.cause.output
+        elif isinstance(e.cause, EnvironmentError):
+            print >>sys.stderr, e.cause
+        sys.exit(1)
+
+    # Complete.
+
+    print format_throughput(
+        used_bytes, os.path.getsize(output_file), elapsed_seconds)
+    print 'Success.'
+
+
+def create_command_line_parser():
+    parser = argparse.ArgumentParser(
+        description=
+        u'Export the root filesystem in an image of Raspberry Pi.')
+
+    parser.add_argument(
+        '-f', '--format', dest='export_format', choices=FORMATS,
+        default=None,
+        help=u'Format of the output file. ' +
+        u'By default, it is detected from the extension of the output file.')
+    parser.add_argument(
+        '-j', '--threads', dest='threads_count', type=int,
+        default=multiprocessing.cpu_count(),
+        help=u'Count of threads of compression.')
+    parser.add_argument(
+        'source', metavar='SOURCE', nargs='?',
+        help=u'Mount point of the root filesystem, or a loop device file ' +
+        u'that the image is attached.')
+    parser.add_argument(
+        'output_file', metavar='OUTPUT_FILE', nargs='?')
+
+    return parser
+
+
+if __name__ == '__main__':
+    # Parse command-line arguments.
+
+    parser = create_command_line_parser()
+    arguments = parser.parse_args()
+
+    # Call main function with parsed arguments.
+    # If there is not arguments, print help and exit.
+
+    if arguments.source and arguments.output_file:
+        main(arguments.source, arguments.output_file,
+             arguments.export_format, arguments.threads_count)
+    else:
+        parser.print_help()
+        sys.exit(1)
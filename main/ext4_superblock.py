@@ -0,0 +1,136 @@
+# The MIT License (MIT)
+#
+# Copyright (c) 2013 Keita Kita
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in
+# all copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN
+# THE SOFTWARE.
+
+
+# ext4_superblock
+#
+# A module that reads a superblock of an ext2/3/4 filesystem.
+
+import struct
+import uuid
+
+# Layout of a superblock.
+
+SUPERBLOCK_OFFSET = 1024
+
+SUPERBLOCK_SIZE = 1024
+
+EXT4_MAGIC = 0xef53
+
+INCOMPAT_64BIT = 0x80
+
+
+class InvalidSuperblockError(Exception):
+    pass
+
+
+class Superblock:
+    def __init__(
+            self, block_size, blocks_count, free_blocks_count, uuid, label):
+        self.__block_size = block_size
+        self.__blocks_count = blocks_count
+        self.__free_blocks_count = free_blocks_count
+        self.__uuid = uuid
+        self.__label = label
+
+    @property
+    def block_size(self):
+        return self.__block_size
+
+    @property
+    def blocks_count(self):
+        return self.__blocks_count
+
+    @property
+    def free_blocks_count(self):
+        return self.__free_blocks_count
+
+    @property
+    def used_blocks_count(self):
+        return self.blocks_count - self.free_blocks_count
+
+    @property
+    def used_bytes(self):
+        return self.used_blocks_count * self.block_size
+
+    @property
+    def uuid(self):
+        return self.__uuid
+
+    @property
+    def label(self):
+        return self.__label
+
+
+def parse_superblock(data):
+    u'''
+    Parse a superblock.
+
+    Argument:
+        data : A string of the superblock.
+    Return:
+        A Superblock.
+    Raise:
+        InvalidSuperblockError : When the string is not a superblock.
+    '''
+    if len(data) < SUPERBLOCK_SIZE:
+        raise InvalidSuperblockError()
+
+    (magic,) = struct.unpack_from('<H', data, 0x38)
+    if magic != EXT4_MAGIC:
+        raise InvalidSuperblockError()
+
+    (blocks_count, free_blocks_count) = struct.unpack_from('<I4xI', data, 0x04)
+    (log_block_size,) = struct.unpack_from('<I', data, 0x18)
+    (feature_incompat,) = struct.unpack_from('<I', data, 0x60)
+
+    # High 32 bits of counts are available only in 64bit filesystems.
+
+    if feature_incompat & INCOMPAT_64BIT:
+        (blocks_count_hi,) = struct.unpack_from('<I', data, 0x150)
+        (free_blocks_count_hi,) = struct.unpack_from('<I', data, 0x158)
+        blocks_count |= blocks_count_hi << 32
+        free_blocks_count |= free_blocks_count_hi << 32
+
+    filesystem_uuid = unicode(uuid.UUID(bytes=data[0x68:0x78]))
+    label = data[0x78:0x88].split('\x00', 1)[0].decode('utf-8', 'replace')
+
+    return Superblock(
+        1024 << log_block_size, blocks_count, free_blocks_count,
+        filesystem_uuid, label)
+
+
+def read_superblock(image_file, partition_offset_bytes):
+    u'''
+    Read a superblock of a filesystem in an image file.
+
+    Arguments:
+        image_file : An image file.
+        partition_offset_bytes : Offset bytes of the partition.
+    Return:
+        A Superblock.
+    Raise:
+        InvalidSuperblockError : When there is not a superblock.
+    '''
+    with open(image_file, 'rb') as f:
+        f.seek(partition_offset_bytes + SUPERBLOCK_OFFSET)
+        return parse_superblock(f.read(SUPERBLOCK_SIZE))
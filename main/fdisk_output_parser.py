@@ -25,6 +25,7 @@
 # A module that parses an output of fdisk.
 
 import re
+import subprocess
 
 
 class ParseError(Exception):
@@ -41,18 +42,27 @@ PARTITION_LIST_ITEM_PATTERN = re.compile(
     ur'^(?P<device>\S+)\s+?\*?\s+' +
     ur'(?P<start_unit_index>\d+)\s+' +
     ur'(?P<end_unit_index>\d+)\s+' +
-    ur'\d+\s+' +
+    ur'\d+\+?\s+' +
     ur'\S+\s+' +
     ur'(?P<system>.+)$')
 
 
+PARTITION_NUMBER_PATTERN = re.compile(ur'(?P<number>\d+)$')
+
+# Systems of extended partitions that contain logical partitions.
+
+EXTENDED_SYSTEMS = [u'Extended', u"W95 Ext'd (LBA)", u'Linux extended']
+
+
 class Partition:
     def __init__(
-            self, bytes_par_unit, start_unit_index, end_unit_index, system):
+            self, bytes_par_unit, start_unit_index, end_unit_index, system,
+            device=None):
         self.__bytes_par_unit = bytes_par_unit
         self.__start_unit_index = start_unit_index
         self.__end_unit_index = end_unit_index
         self.__system = system
+        self.__device = device
 
     @property
     def bytes_par_unit(self):
@@ -78,6 +88,29 @@ class Partition:
     def system(self):
         return self.__system
 
+    @property
+    def device(self):
+        return self.__device
+
+    @property
+    def number(self):
+        u'''
+        The number of the partition that fdisk appends to the device name.
+        If the device is unknown, None is returned.
+        '''
+        if self.device is None:
+            return None
+
+        match = PARTITION_NUMBER_PATTERN.search(self.device)
+        if match:
+            return int(match.group(u'number'))
+        else:
+            return None
+
+    @property
+    def is_extended(self):
+        return self.system in EXTENDED_SYSTEMS
+
 
 def detect_partitions(fdisk_output):
     u'''
@@ -118,11 +151,12 @@ def detect_partitions(fdisk_output):
                 start_unit_index = int(match.group(u'start_unit_index'))
                 end_unit_index = int(match.group(u'end_unit_index'))
                 system = unicode(match.group(u'system'))
+                device = unicode(match.group(u'device'))
 
                 partitions.append(
                     Partition(
                         bytes_par_unit, start_unit_index,
-                        end_unit_index, system))
+                        end_unit_index, system, device))
 
     # Check the detection is complete.
 
@@ -130,3 +164,24 @@ def detect_partitions(fdisk_output):
         raise ParseError()
 
     return partitions
+
+
+def read_partitions(device_file):
+    u'''
+    Run fdisk on a device or an image file and detect partitions.
+
+    fdisk reads an image file directly, so no loop device is needed.
+    Logical partitions are contained.
+
+    Parameters:
+        device_file : A device file or an image file.
+    Return:
+        A list that contains Partitions.
+    Raise:
+        subprocess.CalledProcessError : When fdisk is failed.
+        OSError : When fdisk cannot be executed.
+        ParseError : When the output of fdisk is invalid.
+    '''
+    fdisk_output = subprocess.check_output(
+        ['fdisk', '-lu', device_file], stderr=subprocess.STDOUT)
+    return detect_partitions(fdisk_output)
@@ -0,0 +1,413 @@
+#!/usr/bin/env python
+
+# The MIT License (MIT)
+#
+# Copyright (c) 2013 Keita Kita
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in
+# all copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN
+# THE SOFTWARE.
+
+
+# inventory_images
+#
+# A script that scans a directory tree for images of Raspberry Pi and writes
+# an index of their partitions and root filesystems.
+#
+# Partitions are read by fdisk from the image file directly, so no loop
+# device is used. The index is also a cache: a file that has the same size
+# and modification time as its entry in the index is not scanned again.
+
+import argparse
+import csv
+import fnmatch
+import json
+import multiprocessing
+import multiprocessing.dummy
+import os
+import os.path
+import subprocess
+import sys
+
+import ext4_superblock
+import fdisk_output_parser
+
+# Paths of os-release in the root filesystem. The first one may be
+# a symbolic link to the second one.
+
+OS_RELEASE_FILES = [u'/etc/os-release', u'/usr/lib/os-release']
+
+# The version of entries. Entries of other versions are scanned again.
+
+ENTRY_VERSION = 2
+
+# The encoding of paths. Paths in the index are unicode and they are encoded
+# only when they are passed to the OS.
+
+PATH_ENCODING = 'utf-8'
+
+CSV_FIELDS = [
+    u'path', u'size', u'partitions', u'root_filesystem_offset', u'uuid',
+    u'label', u'used_bytes', u'os', u'error']
+
+
+def encode_path(path):
+    u'''
+    Encode a path to pass it to the OS.
+
+    Argument:
+        path : A unicode or an encoded path.
+    Return:
+        An encoded path.
+    '''
+    if isinstance(path, unicode):
+        return path.encode(PATH_ENCODING)
+    else:
+        return path
+
+
+def parse_os_release(os_release):
+    u'''
+    Parse a content of os-release.
+
+    Argument:
+        os_release : A string of the content of os-release.
+    Return:
+        A dictionary that maps a key to its value.
+    '''
+    values = {}
+    for line in os_release.splitlines():
+        line = line.strip()
+        if not line or line.startswith(u'#') or u'=' not in line:
+            continue
+
+        key, value = line.split(u'=', 1)
+        if len(value) >= 2 and value[0] == value[-1] and value[0] in u'"\'':
+            value = value[1:-1]
+        values[key] = value
+
+    return values
+
+
+def read_os_release(image_file, partition_offset_bytes):
+    u'''
+    Read os-release in the root filesystem with debugfs.
+
+    Arguments:
+        image_file : An image file.
+        partition_offset_bytes : Offset bytes of the root filesystem.
+    Return:
+        A dictionary of os-release. If it cannot be read, an empty dictionary
+        is returned.
+    '''
+    device = '%s?offset=%d' % (
+        encode_path(image_file), partition_offset_bytes)
+    for os_release_file in OS_RELEASE_FILES:
+        try:
+            with open(os.devnull, 'w') as null:
+                os_release = subprocess.check_output(
+                    ['debugfs', '-R', 'cat ' + os_release_file, device],
+                    stderr=null)
+        except (subprocess.CalledProcessError, OSError):
+            continue
+
+        values = parse_os_release(os_release.decode('utf-8', 'replace'))
+        if values:
+            return values
+    else:
+        return {}
+
+
+def is_entry_fresh(entry, size, modification_time):
+    u'''
+    Check that an entry of the index is for the current file.
+
+    Arguments:
+        entry : An entry of the index. It may be None.
+        size : The current size of the file.
+        modification_time : The current modification time of the file.
+    Return:
+        True if the entry can be reused.
+    '''
+    return entry is not None and \
+        entry.get(u'version') == ENTRY_VERSION and \
+        entry.get(u'size') == size and \
+        entry.get(u'mtime') == modification_time
+
+
+def describe_image(entry, image_file, partitions):
+    u'''
+    Describe partitions and the root filesystem of an image in an entry.
+
+    Extended partitions are not described because they only contain logical
+    partitions.
+
+    Arguments:
+        entry : An entry of the index. It is updated.
+        image_file : An image file.
+        partitions : A list of Partitions in the image file.
+    '''
+    partitions = [partition for partition in partitions
+                  if not partition.is_extended]
+    entry[u'partitions'] = [
+        {u'number': partition.number,
+         u'start_offset_bytes': partition.start_offset_bytes,
+         u'end_offset_bytes': partition.end_offset_bytes,
+         u'system': partition.system}
+        for partition in partitions]
+
+    for partition in partitions:
+        if partition.system == u'Linux':
+            root_offset = partition.start_offset_bytes
+            break
+    else:
+        entry[u'error'] = u'Root filesystem is not found.'
+        return
+
+    entry[u'root_filesystem_offset'] = root_offset
+
+    try:
+        superblock = ext4_superblock.read_superblock(image_file, root_offset)
+    except (ext4_superblock.InvalidSuperblockError, IOError):
+        entry[u'error'] = u'Superblock cannot be read.'
+        return
+
+    entry[u'uuid'] = superblock.uuid
+    entry[u'label'] = superblock.label
+    entry[u'used_bytes'] = superblock.used_bytes
+    entry[u'os_release'] = read_os_release(image_file, root_offset)
+
+
+def scan_image(image_file, size, modification_time):
+    u'''
+    Scan an image file.
+
+    Arguments:
+        image_file : An image file.
+        size : The size of the file.
+        modification_time : The modification time of the file.
+    Return:
+        An entry of the index.
+    '''
+    entry = {u'version': ENTRY_VERSION, u'size': size,
+             u'mtime': modification_time}
+
+    try:
+        partitions = fdisk_output_parser.read_partitions(image_file)
+    except (subprocess.CalledProcessError, OSError,
+            fdisk_output_parser.ParseError):
+        entry[u'error'] = u'Partition table cannot be read.'
+        return entry
+
+    describe_image(entry, image_file, partitions)
+    return entry
+
+
+def find_image_files(directory, pattern):
+    u'''
+    Find image files in a directory tree.
+
+    Files whose paths cannot be decoded are skipped.
+
+    Arguments:
+        directory : A directory.
+        pattern : A pattern of names of image files.
+    Return:
+        A list of unicode paths relative to the directory.
+    '''
+    encoded_directory = encode_path(directory)
+    encoded_pattern = encode_path(pattern)
+
+    image_files = []
+    for parent, _, names in os.walk(encoded_directory):
+        for name in fnmatch.filter(names, encoded_pattern):
+            image_file = os.path.relpath(
+                os.path.join(parent, name), encoded_directory)
+            try:
+                image_files.append(image_file.decode(PATH_ENCODING))
+            except UnicodeDecodeError:
+                continue
+
+    return sorted(image_files)
+
+
+def load_index(index_file):
+    u'''
+    Load an index. If the index does not exist, an empty index is returned.
+    '''
+    if not os.path.exists(index_file):
+        return {}
+
+    with open(index_file) as f:
+        return json.load(f)
+
+
+def save_index(index_file, index):
+    u'''
+    Save an index. The index is replaced atomically.
+    '''
+    temporary_file = index_file + u'.tmp'
+    with open(temporary_file, 'w') as f:
+        json.dump(index, f, indent=2, sort_keys=True)
+    os.rename(temporary_file, index_file)
+
+
+def save_csv(csv_file, index):
+    u'''
+    Save an index as CSV.
+    '''
+    with open(csv_file, 'wb') as f:
+        writer = csv.writer(f)
+        writer.writerow(CSV_FIELDS)
+        for path in sorted(index.iterkeys()):
+            entry = index[path]
+            partitions = u';'.join(
+                u'%s:%d-%d' % (
+                    partition[u'system'], partition[u'start_offset_bytes'],
+                    partition[u'end_offset_bytes'])
+                for partition in entry.get(u'partitions', []))
+            row = [
+                path, entry.get(u'size'), partitions,
+                entry.get(u'root_filesystem_offset'), entry.get(u'uuid'),
+                entry.get(u'label'), entry.get(u'used_bytes'),
+                entry.get(u'os_release', {}).get(u'PRETTY_NAME'),
+                entry.get(u'error')]
+            writer.writerow([
+                u'' if value is None else unicode(value).encode('utf-8')
+                for value in row])
+
+
+def inventory(directory, index, pattern, threads_count):
+    u'''
+    Scan image files in a directory tree.
+
+    Arguments:
+        directory : A directory.
+        index : A previous index. It maps a relative path to an entry.
+        pattern : A pattern of names of image files.
+        threads_count : A count of threads of scanning.
+    Return:
+        A tuple of a new index and a count of scanned files.
+    '''
+    encoded_directory = encode_path(directory)
+
+    new_index = {}
+    scanning_files = []
+    for image_file in find_image_files(directory, pattern):
+        # A file may be removed while the directory is scanned.
+        try:
+            status = os.stat(os.path.join(
+                encoded_directory, encode_path(image_file)))
+        except OSError:
+            continue
+
+        entry = index.get(image_file)
+        if is_entry_fresh(entry, status.st_size, status.st_mtime):
+            new_index[image_file] = entry
+        else:
+            scanning_files.append(
+                (image_file, status.st_size, status.st_mtime))
+
+    def scan(arguments):
+        image_file, size, modification_time = arguments
+        return (image_file, scan_image(
+            os.path.join(encoded_directory, encode_path(image_file)),
+            size, modification_time))
+
+    # Scanning waits for I/O and debugfs, so threads are enough.
+
+    pool = multiprocessing.dummy.Pool(threads_count)
+    try:
+        for image_file, entry in pool.imap_unordered(scan, scanning_files):
+            new_index[image_file] = entry
+    finally:
+        pool.close()
+        pool.join()
+
+    return (new_index, len(scanning_files))
+
+
+def main(directory, index_file, csv_file, pattern, threads_count):
+    # Check the directory exists.
+    # If it does not exist, print an error message and exit.
+
+    if not os.path.isdir(directory):
+        print >>sys.stderr, "Directory does not exist : " + directory
+        sys.exit(1)
+
+    try:
+        index = load_index(index_file)
+    except ValueError:
+        print >>sys.stderr, "Index file is invalid : " + index_file
+        sys.exit(1)
+
+    # Scan new or changed image files.
+
+    print '--- Scan images in %s ---' % directory
+
+    new_index, scanned_count = inventory(
+        directory, index, pattern, threads_count)
+
+    # Write the index.
+
+    save_index(index_file, new_index)
+    if csv_file:
+        save_csv(csv_file, new_index)
+
+    print '%d images, %d scanned.' % (len(new_index), scanned_count)
+
+
+def create_command_line_parser():
+    parser = argparse.ArgumentParser(
+        description=u'Write an index of partitions and root filesystems ' +
+        u'of images in a directory tree.')
+
+    parser.add_argument(
+        '-c', '--csv', dest='csv_file', default=None,
+        help=u'Path of a CSV file of the index.')
+    parser.add_argument(
+        '-p', '--pattern', dest='pattern', default=u'*.img',
+        help=u'Pattern of names of image files.')
+    parser.add_argument(
+        '-j', '--threads', dest='threads_count', type=int,
+        default=multiprocessing.cpu_count() * 2,
+        help=u'Count of threads of scanning.')
+    parser.add_argument(
+        'directory', metavar='DIRECTORY', nargs='?')
+    parser.add_argument(
+        'index_file', metavar='INDEX_FILE', nargs='?',
+        help=u'Path of a JSON file of the index. ' +
+        u'An existing index is used to skip unchanged images.')
+
+    return parser
+
+
+if __name__ == '__main__':
+    # Parse command-line arguments.
+
+    parser = create_command_line_parser()
+    arguments = parser.parse_args()
+
+    # Call main function with parsed arguments.
+    # If there is not arguments, print help and exit.
+
+    if arguments.directory and arguments.index_file:
+        main(arguments.directory, arguments.index_file, arguments.csv_file,
+             arguments.pattern, arguments.threads_count)
+    else:
+        parser.print_help()
+        sys.exit(1)
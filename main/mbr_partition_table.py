@@ -0,0 +1,221 @@
+# The MIT License (MIT)
+#
+# Copyright (c) 2013 Keita Kita
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in
+# all copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN
+# THE SOFTWARE.
+
+
+# mbr_partition_table
+#
+# A module that reads and rewrites a partition table in a Master Boot Record.
+
+import os
+import struct
+
+# Layout of a Master Boot Record.
+
+MBR_SIZE = 512
+
+PARTITION_TABLE_OFFSET = 446
+
+PARTITION_ENTRY_SIZE = 16
+
+PARTITION_ENTRY_COUNT = 4
+
+SIGNATURE_OFFSET = 510
+
+SIGNATURE = '\x55\xaa'
+
+BYTES_PAR_SECTOR = 512
+
+# Offsets in a partition entry.
+
+PARTITION_TYPE_OFFSET = 4
+
+LAST_SECTOR_CHS_OFFSET = 5
+
+START_SECTOR_OFFSET = 8
+
+SECTORS_COUNT_OFFSET = 12
+
+# A CHS address that means "use LBA" for partitions beyond 8 GiB.
+
+MAXIMUM_CHS_ADDRESS = '\xfe\xff\xff'
+
+EMPTY_PARTITION_TYPE = 0x00
+
+# The count of sectors of a partition entry is 32 bits.
+
+MAXIMUM_SECTORS_COUNT = 0xffffffff
+
+
+class InvalidMbrError(Exception):
+    pass
+
+
+class PartitionEntry:
+    def __init__(self, index, partition_type, start_sector, sectors_count):
+        self.__index = index
+        self.__partition_type = partition_type
+        self.__start_sector = start_sector
+        self.__sectors_count = sectors_count
+
+    @property
+    def index(self):
+        return self.__index
+
+    @property
+    def partition_type(self):
+        return self.__partition_type
+
+    @property
+    def start_sector(self):
+        return self.__start_sector
+
+    @property
+    def sectors_count(self):
+        return self.__sectors_count
+
+    @property
+    def start_offset_bytes(self):
+        return self.start_sector * BYTES_PAR_SECTOR
+
+    @property
+    def size_bytes(self):
+        return self.sectors_count * BYTES_PAR_SECTOR
+
+
+def check_mbr(mbr):
+    u'''
+    Check that a string is a Master Boot Record.
+
+    Argument:
+        mbr : A string of the first sector of an image.
+    Raise:
+        InvalidMbrError : When the string is not a Master Boot Record.
+    '''
+    if len(mbr) < MBR_SIZE or \
+            mbr[SIGNATURE_OFFSET:SIGNATURE_OFFSET + 2] != SIGNATURE:
+        raise InvalidMbrError()
+
+
+def read_partition_entries(mbr):
+    u'''
+    Read partition entries from a Master Boot Record.
+
+    Argument:
+        mbr : A string of the first sector of an image.
+    Return:
+        A list of PartitionEntry. Empty entries are not contained.
+    Raise:
+        InvalidMbrError : When the string is not a Master Boot Record.
+    '''
+    check_mbr(mbr)
+
+    entries = []
+    for index in range(PARTITION_ENTRY_COUNT):
+        entry_offset = PARTITION_TABLE_OFFSET + index * PARTITION_ENTRY_SIZE
+
+        partition_type = ord(mbr[entry_offset + PARTITION_TYPE_OFFSET])
+        (start_sector, sectors_count) = struct.unpack_from(
+            '<II', mbr, entry_offset + START_SECTOR_OFFSET)
+
+        if partition_type != EMPTY_PARTITION_TYPE and sectors_count > 0:
+            entries.append(PartitionEntry(
+                index, partition_type, start_sector, sectors_count))
+
+    return entries
+
+
+def find_partition_entry(mbr, start_offset_bytes):
+    u'''
+    Find a partition entry that starts at the offset.
+
+    Arguments:
+        mbr : A string of the first sector of an image.
+        start_offset_bytes : Offset bytes of the partition.
+    Return:
+        A PartitionEntry. If there is no such partition, None is returned.
+    Raise:
+        InvalidMbrError : When the string is not a Master Boot Record.
+    '''
+    for entry in read_partition_entries(mbr):
+        if entry.start_offset_bytes == start_offset_bytes:
+            return entry
+    else:
+        return None
+
+
+def resize_partition_entry(mbr, index, sectors_count):
+    u'''
+    Rewrite the count of sectors of a partition entry.
+
+    Only the length and the CHS address of the last sector of the entry are
+    rewritten. The CHS address is set to the maximum value because
+    the partition is addressed by LBA.
+
+    Arguments:
+        mbr : A string of the first sector of an image.
+        index : An index of the rewritten partition entry.
+        sectors_count : A new count of sectors of the partition.
+    Return:
+        A string of the rewritten Master Boot Record.
+    Raise:
+        InvalidMbrError : When the string is not a Master Boot Record.
+        ValueError : When the count of sectors is out of 32 bits.
+    '''
+    check_mbr(mbr)
+    if not 0 <= sectors_count <= MAXIMUM_SECTORS_COUNT:
+        raise ValueError(sectors_count)
+
+    entry_offset = PARTITION_TABLE_OFFSET + index * PARTITION_ENTRY_SIZE
+    chs_offset = entry_offset + LAST_SECTOR_CHS_OFFSET
+    count_offset = entry_offset + SECTORS_COUNT_OFFSET
+
+    return mbr[:chs_offset] + MAXIMUM_CHS_ADDRESS + \
+        mbr[chs_offset + len(MAXIMUM_CHS_ADDRESS):count_offset] + \
+        struct.pack('<I', sectors_count) + \
+        mbr[count_offset + 4:]
+
+
+def read_mbr(image_file):
+    u'''
+    Read a Master Boot Record from an image file.
+
+    Argument:
+        image_file : An image file.
+    Return:
+        A string of the first sector of the image file.
+    '''
+    with open(image_file, 'rb') as f:
+        return f.read(MBR_SIZE)
+
+
+def write_mbr(image_file, mbr):
+    u'''
+    Write a Master Boot Record to an image file.
+
+    Arguments:
+        image_file : An image file.
+        mbr : A string of the Master Boot Record.
+    '''
+    with open(image_file, 'r+b') as f:
+        f.write(mbr[:MBR_SIZE])
+        f.flush()
+        os.fsync(f.fileno())
@@ -0,0 +1,349 @@
+# The MIT License (MIT)
+#
+# Copyright (c) 2013 Keita Kita
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in
+# all copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN
+# THE SOFTWARE.
+
+
+# metrics
+#
+# A module that records metrics of scripts to a textfile of the Prometheus
+# node exporter.
+#
+# Scripts run for a short time, so metrics are accumulated in a state file
+# next to the textfile, and the textfile is rewritten from the state.
+# Metrics are recorded only after configure() is called.
+
+import contextlib
+import fcntl
+import json
+import os
+import os.path
+import sys
+import time
+
+METRIC_PREFIX = u'raspberry_pi_image'
+
+# Upper bounds of buckets of latency histograms in seconds.
+
+LATENCY_BUCKETS = [0.01, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0,
+                   60.0, 300.0]
+
+SYSFS_BLOCK_DIRECTORY = u'/sys/block'
+
+PROC_MOUNTS_FILE = u'/proc/mounts'
+
+DELETED_SUFFIX = u' (deleted)'
+
+STATE_FILE_SUFFIX = u'.state.json'
+
+
+class MetricsRecorder:
+    u'''
+    A recorder of latencies and failures of a script.
+
+    If the textfile is None, nothing is written.
+    '''
+    def __init__(self, textfile, script):
+        self.__textfile = textfile
+        self.__script = script
+        self.__latencies = []
+        self.__failures = []
+
+    def observe(self, phase, seconds):
+        self.__latencies.append((phase, seconds))
+
+    def count_failure(self, step):
+        self.__failures.append(step)
+
+    @contextlib.contextmanager
+    def phase(self, name):
+        u'''
+        Measure the latency of a phase. When the phase raises an exception
+        or exits with an error status, a failure of the phase is counted.
+        '''
+        start_time = time.time()
+        try:
+            yield
+        except SystemExit, e:
+            if e.code:
+                self.count_failure(name)
+            raise
+        except Exception:
+            self.count_failure(name)
+            raise
+        finally:
+            self.observe(name, time.time() - start_time)
+
+    def write(self, sysfs_block_directory=SYSFS_BLOCK_DIRECTORY):
+        u'''
+        Merge recorded metrics into the state and rewrite the textfile.
+        '''
+        if self.__textfile is None:
+            return
+
+        state_file = self.__textfile + STATE_FILE_SUFFIX
+        with open(state_file, 'a+') as f:
+            fcntl.flock(f.fileno(), fcntl.LOCK_EX)
+
+            f.seek(0)
+            content = f.read()
+            state = json.loads(content) if content else {}
+            merge_metrics(
+                state, self.__script, self.__latencies, self.__failures)
+
+            f.seek(0)
+            f.truncate()
+            json.dump(state, f, sort_keys=True)
+            f.flush()
+
+            # Write the textfile atomically because the node exporter may
+            # read it at any time.
+            temporary_file = self.__textfile + u'.tmp'
+            with open(temporary_file, 'w') as textfile:
+                textfile.write(render_textfile(
+                    state, count_loop_devices(sysfs_block_directory)))
+            os.rename(temporary_file, self.__textfile)
+
+        self.__latencies = []
+        self.__failures = []
+
+
+def merge_metrics(state, script, latencies, failures):
+    u'''
+    Merge latencies and failures into a state.
+
+    Arguments:
+        state : A dictionary of the state. It is updated.
+        script : A name of the script.
+        latencies : A list of tuples of a phase and seconds.
+        failures : A list of failed steps.
+    '''
+    histograms = state.setdefault(u'histograms', {})
+    for phase, seconds in latencies:
+        histogram = histograms.setdefault(
+            u'%s/%s' % (script, phase),
+            {u'buckets': [0] * len(LATENCY_BUCKETS), u'sum': 0.0,
+             u'count': 0})
+        for index, upper_bound in enumerate(LATENCY_BUCKETS):
+            if seconds <= upper_bound:
+                histogram[u'buckets'][index] += 1
+        histogram[u'sum'] += seconds
+        histogram[u'count'] += 1
+
+    failure_counts = state.setdefault(u'failures', {})
+    for step in failures:
+        key = u'%s/%s' % (script, step)
+        failure_counts[key] = failure_counts.get(key, 0) + 1
+
+
+def read_mounted_devices(mounts_file=PROC_MOUNTS_FILE):
+    u'''
+    Read devices that are mounted.
+
+    Argument:
+        mounts_file : A file of mounts such as /proc/mounts.
+    Return:
+        A set of device files. If the file cannot be read, an empty set is
+        returned.
+    '''
+    try:
+        with open(mounts_file) as f:
+            return set(line.split()[0] for line in f if line.strip())
+    except IOError:
+        return set()
+
+
+def is_loop_device_in_use(name, sysfs_block_directory, mounted_devices,
+                          backing_files):
+    u'''
+    Check that a loop device is used by a mount, a holder or another loop
+    device.
+
+    Arguments:
+        name : A name of the loop device such as loop0.
+        sysfs_block_directory : A directory of block devices in sysfs.
+        mounted_devices : A set of mounted device files.
+        backing_files : A list of backing files of all loop devices.
+    Return:
+        True if the loop device is used.
+    '''
+    device_file = u'/dev/' + name
+
+    # Partitions of the loop device are named such as /dev/loop0p2.
+    for mounted_device in mounted_devices:
+        if mounted_device == device_file or \
+                mounted_device.startswith(device_file + u'p'):
+            return True
+
+    try:
+        if os.listdir(os.path.join(
+                sysfs_block_directory, name, u'holders')):
+            return True
+    except OSError:
+        pass
+
+    return device_file in backing_files
+
+
+def count_loop_devices(sysfs_block_directory=SYSFS_BLOCK_DIRECTORY,
+                       mounts_file=PROC_MOUNTS_FILE):
+    u'''
+    Count active and orphaned loop devices from sysfs.
+
+    A loop device is active when it has a backing file. It is orphaned when
+    its backing file is deleted or missing, or when it is neither mounted,
+    held by another device nor used as a backing file of another loop
+    device.
+
+    Arguments:
+        sysfs_block_directory : A directory of block devices in sysfs.
+        mounts_file : A file of mounts such as /proc/mounts.
+    Return:
+        A tuple of counts of active and orphaned loop devices.
+    '''
+    try:
+        names = os.listdir(sysfs_block_directory)
+    except OSError:
+        return (0, 0)
+
+    backing_files = {}
+    for name in names:
+        if not name.startswith(u'loop'):
+            continue
+
+        try:
+            with open(os.path.join(
+                    sysfs_block_directory, name, u'loop',
+                    u'backing_file')) as f:
+                backing_files[name] = f.read().strip()
+        except IOError:
+            # A loop device without backing file is not attached.
+            continue
+
+    mounted_devices = read_mounted_devices(mounts_file)
+
+    orphaned_count = 0
+    for name, backing_file in backing_files.iteritems():
+        if backing_file.endswith(DELETED_SUFFIX) or \
+                not os.path.exists(backing_file) or \
+                not is_loop_device_in_use(
+                    name, sysfs_block_directory, mounted_devices,
+                    backing_files.values()):
+            orphaned_count += 1
+
+    return (len(backing_files), orphaned_count)
+
+
+def format_labels(labels):
+    return u'{%s}' % u','.join(
+        u'%s="%s"' % (key, value) for key, value in labels)
+
+
+def render_textfile(state, loop_device_counts):
+    u'''
+    Render a textfile of the Prometheus exposition format.
+
+    Arguments:
+        state : A dictionary of the state.
+        loop_device_counts : A tuple of counts of active and orphaned loop
+                             devices.
+    Return:
+        A string of the textfile.
+    '''
+    lines = []
+
+    name = METRIC_PREFIX + u'_phase_seconds'
+    lines.append(u'# HELP %s Latency of phases of scripts.' % name)
+    lines.append(u'# TYPE %s histogram' % name)
+    for key, histogram in sorted(state.get(u'histograms', {}).iteritems()):
+        script, phase = key.split(u'/', 1)
+        labels = [(u'script', script), (u'phase', phase)]
+        for upper_bound, count in zip(
+                LATENCY_BUCKETS, histogram[u'buckets']):
+            lines.append(u'%s_bucket%s %d' % (
+                name, format_labels(labels + [(u'le', repr(upper_bound))]),
+                count))
+        lines.append(u'%s_bucket%s %d' % (
+            name, format_labels(labels + [(u'le', u'+Inf')]),
+            histogram[u'count']))
+        lines.append(u'%s_sum%s %r' % (
+            name, format_labels(labels), histogram[u'sum']))
+        lines.append(u'%s_count%s %d' % (
+            name, format_labels(labels), histogram[u'count']))
+
+    name = METRIC_PREFIX + u'_failures_total'
+    lines.append(u'# HELP %s Failures of steps of scripts.' % name)
+    lines.append(u'# TYPE %s counter' % name)
+    for key, count in sorted(state.get(u'failures', {}).iteritems()):
+        script, step = key.split(u'/', 1)
+        lines.append(u'%s%s %d' % (
+            name, format_labels([(u'script', script), (u'step', step)]),
+            count))
+
+    name = METRIC_PREFIX + u'_loop_devices'
+    active_count, orphaned_count = loop_device_counts
+    lines.append(u'# HELP %s Attached loop devices.' % name)
+    lines.append(u'# TYPE %s gauge' % name)
+    lines.append(u'%s%s %d' % (
+        name, format_labels([(u'state', u'active')]), active_count))
+    lines.append(u'%s%s %d' % (
+        name, format_labels([(u'state', u'orphaned')]), orphaned_count))
+
+    return u'\n'.join(lines) + u'\n'
+
+
+# The recorder of the running script.
+
+recorder = MetricsRecorder(None, None)
+
+
+def configure(textfile, script):
+    u'''
+    Start recording metrics of a script to a textfile.
+
+    Arguments:
+        textfile : A path of the textfile. If it is None, nothing is written.
+        script : A name of the script.
+    '''
+    global recorder
+    recorder = MetricsRecorder(textfile, script)
+
+
+def observe(phase, seconds):
+    recorder.observe(phase, seconds)
+
+
+def count_failure(step):
+    recorder.count_failure(step)
+
+
+def phase(name):
+    return recorder.phase(name)
+
+
+def write():
+    u'''
+    Write metrics of the running script. Metrics are only for monitoring,
+    so a failure is printed and ignored.
+    '''
+    try:
+        recorder.write()
+    except (IOError, OSError, ValueError), e:
+        print >>sys.stderr, 'Metrics are not written : %s' % e
@@ -0,0 +1,106 @@
+# The MIT License (MIT)
+#
+# Copyright (c) 2013 Keita Kita
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in
+# all copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN
+# THE SOFTWARE.
+
+
+# mount_profiles
+#
+# A module that defines profiles of mounting the root filesystem.
+#
+# A profile consists of ext4 mount options and the flush behavior on
+# unmounting.
+
+# Names of profiles.
+
+BUILD_PROFILE = u'build'
+
+SHIP_PROFILE = u'ship'
+
+READONLY_PROFILE = u'readonly'
+
+
+class MountProfile:
+    def __init__(self, name, options, syncs_before_unmount):
+        self.__name = name
+        self.__options = options
+        self.__syncs_before_unmount = syncs_before_unmount
+
+    @property
+    def name(self):
+        return self.__name
+
+    @property
+    def options(self):
+        return self.__options
+
+    @property
+    def syncs_before_unmount(self):
+        return self.__syncs_before_unmount
+
+
+# The profile for throwaway build jobs trades durability for speed.
+# The profile for shipped images keeps safe defaults and syncs explicitly.
+
+PROFILES = dict((profile.name, profile) for profile in [
+    MountProfile(
+        BUILD_PROFILE,
+        [u'noatime', u'commit=60', u'nobarrier', u'data=writeback'],
+        False),
+    MountProfile(
+        SHIP_PROFILE, [u'barrier=1', u'data=ordered'], True),
+    MountProfile(
+        READONLY_PROFILE, [u'ro'], False)])
+
+PROFILE_NAMES = sorted(PROFILES.iterkeys())
+
+
+def get_profile(name):
+    u'''
+    Get a profile.
+
+    Argument:
+        name : A name of the profile. It may be None.
+    Return:
+        A MountProfile. If the name is None, None is returned.
+    Raise:
+        KeyError : When the profile is unknown.
+    '''
+    if name is None:
+        return None
+
+    return PROFILES[name]
+
+
+def create_mount_options(profile, offset):
+    u'''
+    Create an argument of mount -o.
+
+    Arguments:
+        profile : A MountProfile. It may be None.
+        offset : Offset bytes of the root filesystem.
+    Return:
+        A string of mount options.
+    '''
+    options = [u'loop', u'offset=%d' % offset]
+    if profile is not None:
+        options.extend(profile.options)
+
+    return u','.join(options)
@@ -32,6 +32,10 @@ import subprocess
 import sys
 
 import fdisk_output_parser
+import metrics
+import mount_profiles
+import prefetch_profile
+import qcow2_overlay
 
 
 class CannotDetectOffsetError(Exception):
@@ -67,10 +71,74 @@ def detect_root_filesystem_offset(fdisk_output):
 
 
 def detach_loopback_device(loopback_device_file):
-    subprocess.call(['losetup', '-d', loopback_device_file])
+    # A failure of cleanup is not fatal, but it leaks the loop device.
+    if subprocess.call(['losetup', '-d', loopback_device_file]) != 0:
+        metrics.count_failure(u'detach_cleanup')
 
 
-def main(image_file, loopback_device_file, mount_point):
+def detach_device(device_file, is_nbd):
+    u'''
+    Detach an image from a loop device or an NBD device.
+
+    Arguments:
+        device_file : A loop device file or an NBD device file.
+        is_nbd : True if the device is an NBD device.
+    '''
+    if is_nbd:
+        if qcow2_overlay.disconnect_nbd_device(device_file) != 0:
+            metrics.count_failure(u'detach_cleanup')
+    else:
+        detach_loopback_device(device_file)
+
+
+def prefetch(image_file, loopback_device_file, offset, profile_file):
+    u'''
+    Prefetch ranges of hot files in a profile into the page cache.
+
+    Prefetching is only an optimization, so a failure is printed and
+    ignored.
+
+    Arguments:
+        image_file : An image file.
+        loopback_device_file : A loop device file that the image is attached.
+        offset : Offset bytes of the root filesystem.
+        profile_file : A profile of ranges of hot files.
+    '''
+    try:
+        ranges = prefetch_profile.read_profile(profile_file)
+        prefetch_profile.set_read_ahead(
+            loopback_device_file,
+            prefetch_profile.calculate_read_ahead_sectors(ranges))
+        advised_bytes = prefetch_profile.prefetch_ranges(
+            image_file, offset, ranges)
+    except (prefetch_profile.PrefetchError, IOError, OSError), e:
+        print >>sys.stderr, 'Prefetching is skipped : %s' % e
+        return
+
+    print 'Prefetching %d bytes in %d ranges.' % (advised_bytes, len(ranges))
+
+
+def record_prefetch_profile(mount_point, profile_file):
+    u'''
+    Record ranges of hot files in the mounted root filesystem to a profile.
+
+    Arguments:
+        mount_point : A mount point of the root filesystem.
+        profile_file : A profile of ranges of hot files.
+    '''
+    try:
+        ranges = prefetch_profile.record_ranges(mount_point)
+        prefetch_profile.write_profile(profile_file, ranges)
+    except (prefetch_profile.PrefetchError, IOError), e:
+        print >>sys.stderr, 'Recording the profile is failed : %s' % e
+        return
+
+    print 'Recorded %d ranges to %s.' % (len(ranges), profile_file)
+
+
+def main(image_file, loopback_device_file, mount_point,
+         prefetch_profile_file=None, recording_profile_file=None,
+         profile_name=None, is_nbd=False):
     # Check the files exist.
     # If one of the file does not exist, print an error message and exit.
 
@@ -86,50 +154,82 @@ def main(image_file, loopback_device_file, mount_point):
         sys.exit(1)
 
     # Set loopback device for the image.
+    # An NBD device is used instead for a qcow2 overlay.
 
     print '--- Set loopback device %s for %s ---' % (
         loopback_device_file, image_file)
 
-    try:
-        subprocess.check_call(
-            ['losetup', loopback_device_file, image_file],
-            stderr=subprocess.STDOUT)
-    except subprocess.CalledProcessError, e:
-        print >>sys.stderr, e
-        sys.exit(1)
+    if is_nbd:
+        attaching_command = qcow2_overlay.create_nbd_connect_command(
+            loopback_device_file, image_file)
+    else:
+        attaching_command = ['losetup', loopback_device_file, image_file]
+
+    with metrics.phase(u'attach'):
+        try:
+            subprocess.check_call(attaching_command, stderr=subprocess.STDOUT)
+        except subprocess.CalledProcessError, e:
+            print >>sys.stderr, e
+            sys.exit(1)
 
     # Get the offset of partition of the root filesystem.
 
     print '--- Get the offset of partition of the root filesystem ---'
 
-    try:
-        fdisk_output = subprocess.check_output(
-            ['fdisk', '-lu', loopback_device_file],
-            stderr=subprocess.STDOUT)
-        offset = detect_root_filesystem_offset(fdisk_output)
-    except subprocess.CalledProcessError, e:
-        print >>sys.stderr, e
-        detach_loopback_device(loopback_device_file)
-        sys.exit(1)
-    except CannotDetectOffsetError:
-        print >>sys.stderr, \
-            "The offset of the root filesystem cannot be detected."
-        detach_loopback_device(loopback_device_file)
-        sys.exit(1)
+    with metrics.phase(u'detect'):
+        try:
+            fdisk_output = subprocess.check_output(
+                ['fdisk', '-lu', loopback_device_file],
+                stderr=subprocess.STDOUT)
+            offset = detect_root_filesystem_offset(fdisk_output)
+        except subprocess.CalledProcessError, e:
+            print >>sys.stderr, e
+            detach_device(loopback_device_file, is_nbd)
+            sys.exit(1)
+        except CannotDetectOffsetError:
+            print >>sys.stderr, \
+                "The offset of the root filesystem cannot be detected."
+            detach_device(loopback_device_file, is_nbd)
+            sys.exit(1)
+
+    # Prefetch hot files before they are read by the mounted filesystem.
+    # Ranges in a qcow2 overlay do not match ranges in the filesystem.
+
+    if prefetch_profile_file and is_nbd:
+        print >>sys.stderr, 'Prefetching is skipped for an NBD device.'
+    elif prefetch_profile_file:
+        print '--- Prefetch hot files of the root filesystem ---'
+
+        with metrics.phase(u'prefetch'):
+            prefetch(image_file, loopback_device_file, offset,
+                     prefetch_profile_file)
 
     # Mount the partition of the root filesystem.
 
     print '--- Mount the partition of the root filesystem ---'
 
-    try:
-        subprocess.check_call(
-            ['mount', '-o', 'loop,offset=%d' % offset, loopback_device_file,
-                mount_point],
-            stderr=subprocess.STDOUT)
-    except subprocess.CalledProcessError, e:
-        print >>sys.stderr, e
-        detach_loopback_device(loopback_device_file)
-        sys.exit(1)
+    profile = mount_profiles.get_profile(profile_name)
+    if profile is not None:
+        print 'Profile : ' + profile.name
+
+    with metrics.phase(u'mount'):
+        try:
+            subprocess.check_call(
+                ['mount', '-o',
+                    mount_profiles.create_mount_options(profile, offset),
+                    loopback_device_file, mount_point],
+                stderr=subprocess.STDOUT)
+        except subprocess.CalledProcessError, e:
+            print >>sys.stderr, e
+            detach_device(loopback_device_file, is_nbd)
+            sys.exit(1)
+
+    # Record hot files for later mounts.
+
+    if recording_profile_file:
+        print '--- Record hot files of the root filesystem ---'
+
+        record_prefetch_profile(mount_point, recording_profile_file)
 
     # Complete.
 
@@ -140,6 +240,28 @@ def create_command_line_parser():
     parser = argparse.ArgumentParser(
         description=u'Mount the root filesystem in an image of Raspberry Pi.')
 
+    parser.add_argument(
+        '-p', '--profile', dest='profile_name',
+        choices=mount_profiles.PROFILE_NAMES, default=None,
+        help=u'Profile of mount options. Unmount with the same profile.')
+    parser.add_argument(
+        '--nbd', dest='is_nbd', action='store_true', default=False,
+        help=u'Attach the image to LOOPBACK_DEVICE_FILE that is an NBD ' +
+        u'device with qemu-nbd. The image may be a qcow2 overlay.')
+    parser.add_argument(
+        '--metrics', dest='metrics_textfile', default=None,
+        metavar='TEXTFILE',
+        help=u'Textfile of the Prometheus node exporter to record metrics.')
+
+    parser.add_argument(
+        '--prefetch', dest='prefetch_profile_file', default=None,
+        metavar='PROFILE',
+        help=u'Prefetch ranges of hot files in the profile.')
+    parser.add_argument(
+        '--record-prefetch', dest='recording_profile_file', default=None,
+        metavar='PROFILE',
+        help=u'Record ranges of hot files to the profile after mounting.')
+
     parser.add_argument(
         'image_file', metavar='IMAGE_FILE', nargs='?')
     parser.add_argument(
@@ -161,8 +283,14 @@ if __name__ == '__main__':
 
     if arguments.image_file and arguments.loopback_device_file and \
             arguments.mount_point:
-        main(arguments.image_file, arguments.loopback_device_file,
-             arguments.mount_point)
+        metrics.configure(arguments.metrics_textfile, u'mount')
+        try:
+            main(arguments.image_file, arguments.loopback_device_file,
+                 arguments.mount_point, arguments.prefetch_profile_file,
+                 arguments.recording_profile_file, arguments.profile_name,
+                 arguments.is_nbd)
+        finally:
+            metrics.write()
     else:
         parser.print_help()
         sys.exit(1)
@@ -0,0 +1,237 @@
+# The MIT License (MIT)
+#
+# Copyright (c) 2013 Keita Kita
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in
+# all copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN
+# THE SOFTWARE.
+
+
+# partition_filesystem
+#
+# A module that exposes partitions in an image file as regular files with
+# FUSE. Reads and writes are passed through to the image file at the offset
+# of each partition, so no loop device is used.
+#
+# This module requires fusepy only when a filesystem is mounted.
+
+import errno
+import os
+import stat
+import threading
+
+# Flags of open(2) that modify a file.
+
+WRITE_FLAGS = os.O_WRONLY | os.O_RDWR | os.O_APPEND | os.O_TRUNC
+
+# Options of FUSE for large requests.
+
+FUSE_OPTIONS = {'big_writes': True, 'max_readahead': 1024 * 1024}
+
+
+def list_partition_files(partitions):
+    u'''
+    List names of files of partitions.
+
+    A file is named after the number of its partition, such as p1 or p5.
+    Extended partitions are not listed because they only contain logical
+    partitions.
+
+    Argument:
+        partitions : A list of Partitions.
+    Return:
+        A list of tuples of a file name and a Partition.
+    '''
+    partition_files = []
+    for index, partition in enumerate(partitions, 1):
+        if partition.is_extended:
+            continue
+
+        # A Partition that is not detected by fdisk has no number.
+        if partition.number is None:
+            number = index
+        else:
+            number = partition.number
+        partition_files.append((u'p%d' % number, partition))
+
+    return partition_files
+
+
+def clip_length(offset, length, size):
+    u'''
+    Clip a request to the end of a partition.
+
+    Arguments:
+        offset : Offset bytes in the partition.
+        length : Requested bytes.
+        size : Bytes of the partition.
+    Return:
+        Bytes that can be read or written.
+    '''
+    return max(0, min(length, size - offset))
+
+
+class PartitionFilesystem:
+    u'''
+    FUSE operations that expose partitions as files named p1, p2 and so on.
+    '''
+    def __init__(self, image_file, partitions, read_only=False):
+        self.__image_file = image_file
+        self.__read_only = read_only
+        self.__partitions = {}
+        for name, partition in list_partition_files(partitions):
+            self.__partitions[u'/' + name] = partition
+
+        # Each handle has a file descriptor of the image file and a lock,
+        # because seeking and reading are not atomic in Python 2.
+        self.__handles = {}
+        self.__handles_lock = threading.Lock()
+        self.__next_handle = 1
+
+    def __call__(self, operation, *arguments):
+        if not hasattr(self, operation):
+            raise OSError(errno.ENOSYS, operation)
+        return getattr(self, operation)(*arguments)
+
+    def __get_partition(self, path):
+        try:
+            return self.__partitions[path]
+        except KeyError:
+            raise OSError(errno.ENOENT, path)
+
+    @staticmethod
+    def partition_size(partition):
+        u'''
+        Get bytes of a partition. The end unit of a partition is inclusive.
+        '''
+        return partition.end_offset_bytes - partition.start_offset_bytes + \
+            partition.bytes_par_unit
+
+    def getattr(self, path, fh=None):
+        image_status = os.stat(self.__image_file)
+        attributes = {
+            'st_uid': image_status.st_uid,
+            'st_gid': image_status.st_gid,
+            'st_atime': image_status.st_atime,
+            'st_mtime': image_status.st_mtime,
+            'st_ctime': image_status.st_ctime}
+
+        if path == u'/':
+            attributes['st_mode'] = stat.S_IFDIR | 0755
+            attributes['st_nlink'] = 2
+            return attributes
+
+        partition = self.__get_partition(path)
+        mode = stat.S_IMODE(image_status.st_mode)
+        if self.__read_only:
+            mode &= ~(stat.S_IWUSR | stat.S_IWGRP | stat.S_IWOTH)
+        attributes['st_mode'] = stat.S_IFREG | mode
+        attributes['st_nlink'] = 1
+        attributes['st_size'] = self.partition_size(partition)
+        return attributes
+
+    def readdir(self, path, fh):
+        if path != u'/':
+            raise OSError(errno.ENOTDIR, path)
+
+        return [u'.', u'..'] + sorted(
+            name.lstrip(u'/') for name in self.__partitions.iterkeys())
+
+    def open(self, path, flags):
+        self.__get_partition(path)
+
+        if flags & WRITE_FLAGS:
+            if self.__read_only:
+                raise OSError(errno.EROFS, path)
+            if flags & os.O_TRUNC:
+                raise OSError(errno.EPERM, path)
+            open_flags = os.O_RDWR
+        else:
+            open_flags = os.O_RDONLY
+
+        fd = os.open(self.__image_file, open_flags)
+        with self.__handles_lock:
+            handle = self.__next_handle
+            self.__next_handle += 1
+            self.__handles[handle] = (fd, threading.Lock())
+
+        return handle
+
+    def read(self, path, size, offset, fh):
+        partition = self.__get_partition(path)
+        length = clip_length(offset, size, self.partition_size(partition))
+        if length == 0:
+            return ''
+
+        fd, lock = self.__handles[fh]
+        with lock:
+            os.lseek(fd, partition.start_offset_bytes + offset, os.SEEK_SET)
+            return os.read(fd, length)
+
+    def write(self, path, data, offset, fh):
+        partition = self.__get_partition(path)
+        length = clip_length(offset, len(data), self.partition_size(partition))
+        if length == 0:
+            raise OSError(errno.ENOSPC, path)
+
+        fd, lock = self.__handles[fh]
+        with lock:
+            os.lseek(fd, partition.start_offset_bytes + offset, os.SEEK_SET)
+            return os.write(fd, data[:length])
+
+    def truncate(self, path, length, fh=None):
+        # The size of a partition is fixed by the partition table.
+
+        if length != self.partition_size(self.__get_partition(path)):
+            raise OSError(errno.EPERM, path)
+
+    def flush(self, path, fh):
+        return 0
+
+    def fsync(self, path, datasync, fh):
+        fd, lock = self.__handles[fh]
+        if datasync:
+            os.fdatasync(fd)
+        else:
+            os.fsync(fd)
+
+    def release(self, path, fh):
+        with self.__handles_lock:
+            fd, _ = self.__handles.pop(fh)
+        os.close(fd)
+
+
+def mount(image_file, partitions, mount_point, read_only=False):
+    u'''
+    Mount partitions in an image file as files.
+
+    This function returns when the filesystem is unmounted.
+
+    Arguments:
+        image_file : An image file.
+        partitions : A list of Partitions in the image file.
+        mount_point : A mount point.
+        read_only : True if the partitions are not written.
+    Raise:
+        ImportError : When fusepy is not installed.
+        RuntimeError : When mounting is failed.
+    '''
+    import fuse
+
+    fuse.FUSE(
+        PartitionFilesystem(image_file, partitions, read_only), mount_point,
+        foreground=True, nothreads=False, ro=read_only, **FUSE_OPTIONS)
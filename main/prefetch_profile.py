@@ -0,0 +1,310 @@
+# The MIT License (MIT)
+#
+# Copyright (c) 2013 Keita Kita
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in
+# all copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN
+# THE SOFTWARE.
+
+
+# prefetch_profile
+#
+# A module that records byte ranges of hot files in the root filesystem and
+# prefetches them into the page cache.
+#
+# A profile is a text file. Each line is the offset and the length of
+# a range in bytes. Offsets are relative to the partition of the root
+# filesystem, so that the profile can be replayed with the offset that is
+# detected at mounting.
+
+import ctypes
+import ctypes.util
+import glob
+import os
+import os.path
+import re
+import subprocess
+
+# Files that are read first by apt-get and compilers.
+
+DEFAULT_HOT_PATTERNS = [
+    u'var/lib/dpkg/status',
+    u'var/lib/dpkg/available',
+    u'var/cache/apt/*.bin',
+    u'var/lib/apt/lists/*Packages',
+    u'lib/ld-linux*.so*',
+    u'lib/*/ld-*.so',
+    u'lib/*/libc-*.so',
+    u'lib/*/libc.so.6',
+    u'usr/lib/*/libc.so.6',
+    u'usr/lib/*/libstdc++.so.6.*',
+    u'usr/bin/dpkg',
+    u'usr/bin/apt-get',
+    u'usr/bin/gcc-*',
+    u'usr/bin/g++-*',
+    u'usr/bin/as',
+    u'usr/bin/ld.bfd',
+    u'usr/lib/gcc/*/*/cc1',
+    u'usr/lib/gcc/*/*/cc1plus',
+    u'usr/lib/gcc/*/*/collect2']
+
+# Patterns for parsing an output of filefrag -v.
+
+FILEFRAG_BLOCK_SIZE_PATTERN = re.compile(
+    ur'^File size of .+ is \d+ \(\d+ blocks? of (?P<block_size>\d+) bytes\)')
+
+FILEFRAG_EXTENT_PATTERN = re.compile(
+    ur'^\s*\d+:\s+\d+\.\.\s*\d+:\s+' +
+    ur'(?P<physical_start>\d+)\.\.\s*\d+:\s+' +
+    ur'(?P<length>\d+):')
+
+# posix_fadvise(2)
+
+POSIX_FADV_WILLNEED = 3
+
+# Bounds of read-ahead of a loop device in sectors.
+
+MINIMUM_READ_AHEAD_SECTORS = 256
+
+MAXIMUM_READ_AHEAD_SECTORS = 8192
+
+BYTES_PAR_SECTOR = 512
+
+
+class PrefetchError(Exception):
+    pass
+
+
+def parse_filefrag_output(filefrag_output):
+    u'''
+    Parse an output of filefrag -v and detect extents of a file.
+
+    Argument:
+        filefrag_output : An output string of filefrag -v.
+    Return:
+        A list of tuples of offset bytes and length bytes of extents.
+        The offset is relative to the start of the filesystem.
+    '''
+    block_size = None
+    ranges = []
+    for line in filefrag_output.splitlines():
+        if block_size is None:
+            match = FILEFRAG_BLOCK_SIZE_PATTERN.match(line)
+            if match:
+                block_size = int(match.group(u'block_size'))
+            continue
+
+        match = FILEFRAG_EXTENT_PATTERN.match(line)
+        if match:
+            physical_start = int(match.group(u'physical_start'))
+
+            # An extent that is not allocated yet has no physical block.
+            if physical_start == 0:
+                continue
+
+            ranges.append((
+                physical_start * block_size,
+                int(match.group(u'length')) * block_size))
+
+    return ranges
+
+
+def merge_ranges(ranges):
+    u'''
+    Merge overlapping or adjacent ranges.
+
+    Argument:
+        ranges : A list of tuples of offset bytes and length bytes.
+    Return:
+        A sorted list of merged ranges.
+    '''
+    merged_ranges = []
+    for offset, length in sorted(ranges):
+        if merged_ranges:
+            last_offset, last_length = merged_ranges[-1]
+            if offset <= last_offset + last_length:
+                merged_ranges[-1] = (
+                    last_offset,
+                    max(last_length, offset + length - last_offset))
+                continue
+        merged_ranges.append((offset, length))
+
+    return merged_ranges
+
+
+def calculate_read_ahead_sectors(ranges):
+    u'''
+    Calculate read-ahead of a loop device that matches the ranges.
+
+    Argument:
+        ranges : A list of tuples of offset bytes and length bytes.
+    Return:
+        Read-ahead in sectors. It covers the longest range within bounds.
+    '''
+    longest_length = max([length for _, length in ranges] or [0])
+    sectors = -(-longest_length // BYTES_PAR_SECTOR)
+    return min(max(sectors, MINIMUM_READ_AHEAD_SECTORS),
+               MAXIMUM_READ_AHEAD_SECTORS)
+
+
+def find_hot_files(mount_point, patterns):
+    u'''
+    Find hot files in the mounted root filesystem.
+
+    Symbolic links are skipped because an absolute link points to a file
+    of the host. Files under a symbolic link to a directory outside of
+    the root filesystem are also skipped.
+
+    Arguments:
+        mount_point : A mount point of the root filesystem.
+        patterns : A list of patterns of hot files relative to the root.
+    Return:
+        A list of paths of hot files.
+    '''
+    root_directory = os.path.join(os.path.realpath(mount_point), u'')
+
+    hot_files = []
+    for pattern in patterns:
+        for hot_file in glob.glob(os.path.join(mount_point, pattern)):
+            if os.path.islink(hot_file) or not os.path.isfile(hot_file):
+                continue
+            if not os.path.realpath(hot_file).startswith(root_directory):
+                continue
+
+            hot_files.append(hot_file)
+
+    return hot_files
+
+
+def record_ranges(mount_point, patterns=DEFAULT_HOT_PATTERNS):
+    u'''
+    Record ranges of hot files in the mounted root filesystem.
+
+    Arguments:
+        mount_point : A mount point of the root filesystem.
+        patterns : A list of patterns of hot files relative to the root.
+    Return:
+        A list of merged ranges relative to the start of the filesystem.
+    Raise:
+        PrefetchError : When filefrag is failed.
+    '''
+    ranges = []
+    for hot_file in find_hot_files(mount_point, patterns):
+        try:
+            filefrag_output = subprocess.check_output(
+                ['filefrag', '-v', hot_file], stderr=subprocess.STDOUT)
+        except (subprocess.CalledProcessError, OSError), e:
+            raise PrefetchError(e)
+
+        ranges.extend(parse_filefrag_output(filefrag_output))
+
+    return merge_ranges(ranges)
+
+
+def write_profile(profile_file, ranges):
+    u'''
+    Write ranges to a profile.
+    '''
+    with open(profile_file, 'w') as f:
+        for offset, length in ranges:
+            f.write('%d %d\n' % (offset, length))
+
+
+def read_profile(profile_file):
+    u'''
+    Read ranges from a profile.
+
+    Raise:
+        PrefetchError : When the profile is invalid.
+    '''
+    ranges = []
+    with open(profile_file) as f:
+        for line in f:
+            if not line.strip():
+                continue
+
+            try:
+                offset, length = [int(value) for value in line.split()]
+            except ValueError:
+                raise PrefetchError(u'Invalid profile line : ' + line)
+            ranges.append((offset, length))
+
+    return ranges
+
+
+def load_posix_fadvise():
+    u'''
+    Load posix_fadvise of libc. A 64-bit version is preferred so that
+    offsets beyond 2 GiB can be used on 32-bit hosts.
+    '''
+    libc = ctypes.CDLL(ctypes.util.find_library('c'), use_errno=True)
+    try:
+        posix_fadvise = libc.posix_fadvise64
+    except AttributeError:
+        posix_fadvise = libc.posix_fadvise
+    posix_fadvise.argtypes = [
+        ctypes.c_int, ctypes.c_int64, ctypes.c_int64, ctypes.c_int]
+    posix_fadvise.restype = ctypes.c_int
+    return posix_fadvise
+
+
+def prefetch_ranges(image_file, partition_offset_bytes, ranges):
+    u'''
+    Advise the kernel to read ranges of the image file into the page cache.
+
+    Reading is done asynchronously by the kernel.
+
+    Arguments:
+        image_file : An image file.
+        partition_offset_bytes : Offset bytes of the root filesystem.
+        ranges : A list of ranges relative to the root filesystem.
+    Return:
+        Bytes of advised ranges.
+    Raise:
+        PrefetchError : When posix_fadvise is failed.
+    '''
+    posix_fadvise = load_posix_fadvise()
+
+    advised_bytes = 0
+    fd = os.open(image_file, os.O_RDONLY)
+    try:
+        for offset, length in ranges:
+            error_number = posix_fadvise(
+                fd, partition_offset_bytes + offset, length,
+                POSIX_FADV_WILLNEED)
+            if error_number != 0:
+                raise PrefetchError(os.strerror(error_number))
+            advised_bytes += length
+    finally:
+        os.close(fd)
+
+    return advised_bytes
+
+
+def set_read_ahead(loopback_device_file, sectors):
+    u'''
+    Set read-ahead of a loop device.
+
+    Raise:
+        PrefetchError : When blockdev is failed.
+    '''
+    try:
+        subprocess.check_output(
+            ['blockdev', '--setra', str(sectors), loopback_device_file],
+            stderr=subprocess.STDOUT)
+    except (subprocess.CalledProcessError, OSError), e:
+        raise PrefetchError(e)
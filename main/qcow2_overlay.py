@@ -0,0 +1,228 @@
+#!/usr/bin/env python
+
+# The MIT License (MIT)
+#
+# Copyright (c) 2013 Keita Kita
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in
+# all copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN
+# THE SOFTWARE.
+
+
+# qcow2_overlay
+#
+# A script that creates, commits or discards a qcow2 overlay of a base image.
+#
+# An overlay stores only blocks that are changed from the base image, so
+# a job can get its own image in constant time. Overlays are attached to
+# NBD devices with qemu-nbd. The nbd module must be loaded, for example
+# with "modprobe nbd max_part=8".
+
+import argparse
+import errno
+import os
+import os.path
+import subprocess
+import sys
+
+QCOW2_FORMAT = u'qcow2'
+
+RAW_FORMAT = u'raw'
+
+# The first bytes of a qcow2 file.
+
+QCOW2_MAGIC = 'QFI\xfb'
+
+
+def detect_image_format(image_file):
+    u'''
+    Detect the format of an image file from its magic bytes.
+
+    Argument:
+        image_file : An image file.
+    Return:
+        'qcow2' for a qcow2 file, otherwise 'raw'. If the file cannot be
+        read, 'raw' is returned and qemu reports the error.
+    '''
+    try:
+        with open(image_file, 'rb') as f:
+            magic = f.read(len(QCOW2_MAGIC))
+    except IOError:
+        return RAW_FORMAT
+
+    if magic == QCOW2_MAGIC:
+        return QCOW2_FORMAT
+    else:
+        return RAW_FORMAT
+
+
+def create_overlay_command(base_image_file, overlay_file):
+    u'''
+    Create a command that creates an overlay of a base image.
+
+    The path of the base image is absolute because qemu resolves a relative
+    path from the directory of the overlay.
+    '''
+    return [
+        'qemu-img', 'create', '-f', QCOW2_FORMAT,
+        '-b', os.path.abspath(base_image_file),
+        '-F', detect_image_format(base_image_file),
+        overlay_file]
+
+
+def create_commit_command(overlay_file):
+    u'''
+    Create a command that writes changed blocks of an overlay to its base.
+    '''
+    return ['qemu-img', 'commit', overlay_file]
+
+
+def create_nbd_connect_command(nbd_device_file, image_file):
+    u'''
+    Create a command that attaches an image file to an NBD device.
+    '''
+    return [
+        'qemu-nbd', '--connect=' + nbd_device_file,
+        '--format=' + detect_image_format(image_file), image_file]
+
+
+def create_nbd_disconnect_command(nbd_device_file):
+    u'''
+    Create a command that detaches an image file from an NBD device.
+    '''
+    return ['qemu-nbd', '--disconnect', nbd_device_file]
+
+
+def connect_nbd_device(nbd_device_file, image_file):
+    u'''
+    Attach an image file to an NBD device.
+
+    Raise:
+        subprocess.CalledProcessError : When qemu-nbd is failed.
+    '''
+    subprocess.check_output(
+        create_nbd_connect_command(nbd_device_file, image_file),
+        stderr=subprocess.STDOUT)
+
+
+def disconnect_nbd_device(nbd_device_file):
+    u'''
+    Detach an image file from an NBD device.
+
+    Return:
+        The exit status of qemu-nbd.
+    '''
+    return subprocess.call(
+        create_nbd_disconnect_command(nbd_device_file),
+        stderr=subprocess.STDOUT)
+
+
+def create_overlay(base_image_file, overlay_file):
+    u'''
+    Create an overlay of a base image.
+
+    An existing overlay is not overwritten because it has changes of a job.
+
+    Raise:
+        OSError : When the overlay already exists.
+        subprocess.CalledProcessError : When qemu-img is failed.
+    '''
+    if os.path.exists(overlay_file):
+        raise OSError(
+            errno.EEXIST, u'Overlay file already exists', overlay_file)
+
+    subprocess.check_output(
+        create_overlay_command(base_image_file, overlay_file),
+        stderr=subprocess.STDOUT)
+
+
+def commit_overlay(overlay_file):
+    subprocess.check_output(
+        create_commit_command(overlay_file), stderr=subprocess.STDOUT)
+
+
+def discard_overlay(overlay_file):
+    os.remove(overlay_file)
+
+
+def main(command, overlay_file, base_image_file=None):
+    # Check the file exists.
+    # If the file does not exist, print an error message and exit.
+
+    if command == u'create':
+        existing_file = base_image_file
+    else:
+        existing_file = overlay_file
+    if not os.path.exists(existing_file):
+        print >>sys.stderr, "Image file does not exist : " + existing_file
+        sys.exit(1)
+
+    try:
+        if command == u'create':
+            create_overlay(base_image_file, overlay_file)
+        elif command == u'commit':
+            commit_overlay(overlay_file)
+        elif command == u'discard':
+            discard_overlay(overlay_file)
+    except subprocess.CalledProcessError, e:
+        print >>sys.stderr, e.output + str(e)
+        sys.exit(1)
+    except OSError, e:
+        print >>sys.stderr, e
+        sys.exit(1)
+
+    # Complete.
+
+    print 'Success.'
+
+
+def create_command_line_parser():
+    parser = argparse.ArgumentParser(
+        description=u'Create, commit or discard a qcow2 overlay of ' +
+        u'an image of Raspberry Pi.')
+    subparsers = parser.add_subparsers(dest='command')
+
+    create_parser = subparsers.add_parser(
+        'create', help=u'Create an overlay of a base image.')
+    create_parser.add_argument(
+        'base_image_file', metavar='BASE_IMAGE_FILE')
+    create_parser.add_argument(
+        'overlay_file', metavar='OVERLAY_FILE')
+
+    commit_parser = subparsers.add_parser(
+        'commit', help=u'Write changes in an overlay to its base image.')
+    commit_parser.add_argument(
+        'overlay_file', metavar='OVERLAY_FILE')
+
+    discard_parser = subparsers.add_parser(
+        'discard', help=u'Remove an overlay and its changes.')
+    discard_parser.add_argument(
+        'overlay_file', metavar='OVERLAY_FILE')
+
+    return parser
+
+
+if __name__ == '__main__':
+    # Parse command-line arguments.
+
+    parser = create_command_line_parser()
+    arguments = parser.parse_args()
+
+    # Call main function with parsed arguments.
+
+    main(arguments.command, arguments.overlay_file,
+         getattr(arguments, 'base_image_file', None))
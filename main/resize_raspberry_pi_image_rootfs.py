@@ -0,0 +1,402 @@
+#!/usr/bin/env python
+
+# The MIT License (MIT)
+#
+# Copyright (c) 2013 Keita Kita
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in
+# all copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN
+# THE SOFTWARE.
+
+
+# resize_raspberry_pi_image_rootfs
+#
+# A script that grows or shrinks the root filesystem in an image of
+# Raspberry Pi in place.
+#
+# The image file is resized with truncate, so that grown area is sparse and
+# no existing data block is copied.
+
+import argparse
+import os
+import os.path
+import re
+import subprocess
+import sys
+
+import export_raspberry_pi_image_rootfs
+import mbr_partition_table
+import mount_raspberry_pi_image_rootfs
+
+
+class ResizeFailedError(Exception):
+    def __init__(self, message, cause=None):
+        Exception.__init__(self, message)
+        self.__cause = cause
+
+    @property
+    def cause(self):
+        return self.__cause
+
+
+SIZE_PATTERN = re.compile(
+    ur'^(?P<sign>[+-]?)(?P<number>\d+)(?P<unit>[KMGT]?)$')
+
+SIZE_UNITS = {u'': 1, u'K': 1024, u'M': 1024 ** 2, u'G': 1024 ** 3,
+              u'T': 1024 ** 4}
+
+# The exit status of e2fsck when errors are corrected.
+
+E2FSCK_ERRORS_CORRECTED = 1
+
+
+def parse_image_size(size_text, current_size_bytes):
+    u'''
+    Parse a size of the image like truncate.
+
+    A size is a number with an optional unit (K, M, G or T). When the size
+    starts with '+' or '-', it is relative to the current size. The parsed
+    size is rounded down to the size of a sector.
+
+    Arguments:
+        size_text : A string of the size.
+        current_size_bytes : The current size of the image.
+    Return:
+        Bytes of the new size of the image.
+    Raise:
+        ValueError : When the string is not a valid size.
+    '''
+    match = SIZE_PATTERN.match(size_text.upper())
+    if not match:
+        raise ValueError(size_text)
+
+    size_bytes = int(match.group(u'number')) * SIZE_UNITS[match.group(u'unit')]
+
+    sign = match.group(u'sign')
+    if sign == u'+':
+        size_bytes = current_size_bytes + size_bytes
+    elif sign == u'-':
+        size_bytes = current_size_bytes - size_bytes
+
+    return size_bytes - size_bytes % mbr_partition_table.BYTES_PAR_SECTOR
+
+
+def find_loop_devices_over(
+        image_file,
+        sysfs_block_directory=(
+            export_raspberry_pi_image_rootfs.SYSFS_BLOCK_DIRECTORY)):
+    u'''
+    Find loop devices that the image file is attached to.
+
+    Loop devices that are attached to such loop devices are also found,
+    such as a loop device that mount creates with an offset.
+
+    Arguments:
+        image_file : An image file.
+        sysfs_block_directory : A directory of block devices in sysfs.
+    Return:
+        A list of loop device files.
+    '''
+    try:
+        names = sorted(os.listdir(sysfs_block_directory))
+    except OSError:
+        return []
+
+    loop_device_files = [
+        u'/dev/' + name for name in names if name.startswith(u'loop')]
+
+    found_loop_device_files = []
+    backing_files = [image_file]
+    while backing_files:
+        backing_file = backing_files.pop()
+        for loop_device_file in loop_device_files:
+            if loop_device_file not in found_loop_device_files and \
+                    export_raspberry_pi_image_rootfs.is_loop_device_over(
+                        loop_device_file, backing_file, None,
+                        sysfs_block_directory):
+                found_loop_device_files.append(loop_device_file)
+                backing_files.append(loop_device_file)
+
+    return found_loop_device_files
+
+
+def detect_root_partition_entry(image_file, loopback_device_file):
+    u'''
+    Detect the partition entry of the root filesystem in the image file.
+
+    Arguments:
+        image_file : An image file.
+        loopback_device_file : A loop device file used for detection.
+    Return:
+        A PartitionEntry of the root filesystem.
+    Raise:
+        ResizeFailedError : When the partition cannot be detected.
+    '''
+    try:
+        subprocess.check_output(
+            ['losetup', loopback_device_file, image_file],
+            stderr=subprocess.STDOUT)
+    except subprocess.CalledProcessError, e:
+        raise ResizeFailedError(u'Cannot set loopback device.', e)
+
+    try:
+        fdisk_output = subprocess.check_output(
+            ['fdisk', '-lu', loopback_device_file],
+            stderr=subprocess.STDOUT)
+        offset = mount_raspberry_pi_image_rootfs.\
+            detect_root_filesystem_offset(fdisk_output)
+    except subprocess.CalledProcessError, e:
+        raise ResizeFailedError(u'Cannot get partitions of the image.', e)
+    except mount_raspberry_pi_image_rootfs.CannotDetectOffsetError:
+        raise ResizeFailedError(
+            u'The offset of the root filesystem cannot be detected.')
+    finally:
+        mount_raspberry_pi_image_rootfs.detach_loopback_device(
+            loopback_device_file)
+
+    try:
+        mbr = mbr_partition_table.read_mbr(image_file)
+        entries = mbr_partition_table.read_partition_entries(mbr)
+        root_entry = mbr_partition_table.find_partition_entry(mbr, offset)
+    except mbr_partition_table.InvalidMbrError:
+        raise ResizeFailedError(u'The image does not have a valid MBR.')
+
+    if root_entry is None:
+        raise ResizeFailedError(
+            u'The partition entry of the root filesystem is not found.')
+
+    # Only the last partition can be resized without moving data.
+
+    for entry in entries:
+        if entry.start_sector > root_entry.start_sector:
+            raise ResizeFailedError(
+                u'The root filesystem is not the last partition.')
+
+    return root_entry
+
+
+def resize_filesystem(
+        image_file, loopback_device_file, offset_bytes, size_bytes,
+        filesystem_size_sectors=None):
+    u'''
+    Check and resize an ext4 filesystem in the image file.
+
+    Arguments:
+        image_file : An image file.
+        loopback_device_file : A loop device file used for resizing.
+        offset_bytes : Offset bytes of the partition of the filesystem.
+        size_bytes : Bytes of the partition of the filesystem.
+        filesystem_size_sectors : A new count of sectors of the filesystem.
+                                  If it is None, the filesystem fills
+                                  the partition.
+    Raise:
+        ResizeFailedError : When checking or resizing is failed.
+    '''
+    try:
+        subprocess.check_output(
+            ['losetup', '-o', str(offset_bytes), '--sizelimit',
+                str(size_bytes), loopback_device_file, image_file],
+            stderr=subprocess.STDOUT)
+    except subprocess.CalledProcessError, e:
+        raise ResizeFailedError(u'Cannot set loopback device.', e)
+
+    try:
+        # resize2fs requires a filesystem that is checked recently.
+
+        e2fsck_status = subprocess.call(
+            ['e2fsck', '-f', '-y', loopback_device_file])
+        if e2fsck_status > E2FSCK_ERRORS_CORRECTED:
+            raise ResizeFailedError(
+                u'e2fsck failed with status %d.' % e2fsck_status)
+
+        resize2fs_command = ['resize2fs', loopback_device_file]
+        if filesystem_size_sectors is not None:
+            resize2fs_command.append('%ds' % filesystem_size_sectors)
+
+        subprocess.check_output(resize2fs_command, stderr=subprocess.STDOUT)
+    except subprocess.CalledProcessError, e:
+        raise ResizeFailedError(u'Cannot resize the filesystem.', e)
+    finally:
+        mount_raspberry_pi_image_rootfs.detach_loopback_device(
+            loopback_device_file)
+
+
+def resize_image_file(image_file, size_bytes):
+    u'''
+    Resize the image file. A grown area is sparse.
+
+    Arguments:
+        image_file : An image file.
+        size_bytes : Bytes of the new size of the image file.
+    '''
+    with open(image_file, 'r+b') as f:
+        f.truncate(size_bytes)
+
+
+def resize_partition_entry(image_file, root_entry, sectors_count):
+    u'''
+    Rewrite the count of sectors of the partition entry in the image file.
+
+    Arguments:
+        image_file : An image file.
+        root_entry : A PartitionEntry of the root filesystem.
+        sectors_count : A new count of sectors of the partition.
+    '''
+    mbr = mbr_partition_table.read_mbr(image_file)
+    mbr_partition_table.write_mbr(
+        image_file,
+        mbr_partition_table.resize_partition_entry(
+            mbr, root_entry.index, sectors_count))
+
+
+def resize(image_file, loopback_device_file, image_size_bytes):
+    u'''
+    Resize the image file and the root filesystem in it.
+
+    The partition of the root filesystem is extended to the end of
+    the image file.
+
+    Arguments:
+        image_file : An image file.
+        loopback_device_file : A loop device file used for resizing.
+        image_size_bytes : Bytes of the new size of the image file.
+    Raise:
+        ResizeFailedError : When resizing is failed.
+    '''
+    # e2fsck cannot detect that the filesystem is used through another loop
+    # device, so a live filesystem would be corrupted.
+
+    loop_device_files = find_loop_devices_over(image_file)
+    if loop_device_files:
+        raise ResizeFailedError(
+            u'The image is in use by ' + u', '.join(loop_device_files) + u'.')
+
+    print '--- Detect the partition of the root filesystem ---'
+
+    root_entry = detect_root_partition_entry(image_file, loopback_device_file)
+
+    new_sectors_count = image_size_bytes / \
+        mbr_partition_table.BYTES_PAR_SECTOR - root_entry.start_sector
+    if new_sectors_count <= 0:
+        raise ResizeFailedError(
+            u'The size is smaller than the offset of the root filesystem.')
+    if new_sectors_count > mbr_partition_table.MAXIMUM_SECTORS_COUNT:
+        raise ResizeFailedError(
+            u'The size is too large for a partition in an MBR.')
+
+    if new_sectors_count < root_entry.sectors_count:
+        # Shrink the filesystem before its partition and the image.
+
+        print '--- Shrink the root filesystem ---'
+
+        resize_filesystem(
+            image_file, loopback_device_file, root_entry.start_offset_bytes,
+            root_entry.size_bytes, new_sectors_count)
+
+        print '--- Rewrite the partition table ---'
+
+        resize_partition_entry(image_file, root_entry, new_sectors_count)
+
+        print '--- Shrink the image file ---'
+
+        resize_image_file(image_file, image_size_bytes)
+    else:
+        # Grow the image and its partition before the filesystem.
+
+        print '--- Grow the image file ---'
+
+        resize_image_file(image_file, image_size_bytes)
+
+        print '--- Rewrite the partition table ---'
+
+        resize_partition_entry(image_file, root_entry, new_sectors_count)
+
+        print '--- Grow the root filesystem ---'
+
+        resize_filesystem(
+            image_file, loopback_device_file, root_entry.start_offset_bytes,
+            new_sectors_count * mbr_partition_table.BYTES_PAR_SECTOR)
+
+
+def main(image_file, loopback_device_file, image_size):
+    # Check the files exist.
+    # If one of the file does not exist, print an error message and exit.
+
+    if not os.path.exists(image_file):
+        print >>sys.stderr, "Image file does not exist : " + image_file
+        sys.exit(1)
+    if not os.path.exists(loopback_device_file):
+        print >>sys.stderr, \
+            "Loopback device file does not exist : " + loopback_device_file
+        sys.exit(1)
+
+    try:
+        image_size_bytes = parse_image_size(
+            image_size, os.path.getsize(image_file))
+    except ValueError:
+        print >>sys.stderr, "Invalid size : " + image_size
+        sys.exit(1)
+
+    # Resize the image and the root filesystem.
+
+    try:
+        resize(image_file, loopback_device_file, image_size_bytes)
+    except ResizeFailedError, e:
+        print >>sys.stderr, e
+        if isinstance(e.cause, subprocess.CalledProcessError):
+            print >>sys.stderr, e.cause.output + str(e.cause)
+        sys.exit(1)
+
+    # Complete.
+
+    print 'Success.'
+
+
+def create_command_line_parser():
+    parser = argparse.ArgumentParser(
+        description=
+        u'Grow or shrink the root filesystem in an image of Raspberry Pi.')
+
+    parser.add_argument(
+        'image_file', metavar='IMAGE_FILE', nargs='?')
+    parser.add_argument(
+        'loopback_device_file', metavar='LOOPBACK_DEVICE_FILE', nargs='?')
+    parser.add_argument(
+        'image_size', metavar='SIZE', nargs='?',
+        help=u'New size of the image file. ' +
+        u'A size with "+" or "-" is relative to the current size. ' +
+        u'Put "--" before a size with "-".')
+
+    return parser
+
+
+if __name__ == '__main__':
+    # Parse command-line arguments.
+
+    parser = create_command_line_parser()
+    arguments = parser.parse_args()
+
+    # Call main function with parsed arguments.
+    # If there is not arguments, print help and exit.
+
+    if arguments.image_file and arguments.loopback_device_file and \
+            arguments.image_size:
+        main(arguments.image_file, arguments.loopback_device_file,
+             arguments.image_size)
+    else:
+        parser.print_help()
+        sys.exit(1)
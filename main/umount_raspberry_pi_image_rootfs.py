@@ -29,20 +29,70 @@
 import argparse
 import subprocess
 import sys
+import time
 
+import metrics
+import mount_profiles
+import qcow2_overlay
 
-def main(loopback_device_file, mount_point):
+
+def call_with_time(step, command):
+    u'''
+    Call a command and print how long it took.
+
+    Arguments:
+        step : A name of the step.
+        command : A command.
+    Return:
+        Elapsed seconds.
+    '''
+    start_time = time.time()
+    status = subprocess.call(command, stderr=subprocess.STDOUT)
+    elapsed_seconds = time.time() - start_time
+
+    metrics.observe(step, elapsed_seconds)
+    if status != 0:
+        metrics.count_failure(step)
+
+    print '%s : %.3f s' % (step, elapsed_seconds)
+    return elapsed_seconds
+
+
+def main(loopback_device_file, mount_point, profile_name=None,
+         is_nbd=False):
     # This function does not check any error. Because this function forces to
     # unmount and detach.
 
-    # Unmount the mount point.
+    profile = mount_profiles.get_profile(profile_name)
+    total_seconds = 0.0
+
+    # Write dirty pages of the filesystem explicitly if the profile requires.
+
+    if profile is not None and profile.syncs_before_unmount:
+        total_seconds += call_with_time(
+            u'sync', ['sync', '-f', mount_point])
+
+    # Unmount the mount point. Remaining dirty pages are written here.
 
-    subprocess.call(['umount', mount_point], stderr=subprocess.STDOUT)
+    total_seconds += call_with_time(u'umount', ['umount', mount_point])
 
-    # Detach the loop device.
+    # Flush buffers of the loop device to the image file before detaching.
 
-    subprocess.call(
-        ['losetup', '-d', loopback_device_file], stderr=subprocess.STDOUT)
+    if profile is not None and profile.syncs_before_unmount:
+        total_seconds += call_with_time(
+            u'flush', ['blockdev', '--flushbufs', loopback_device_file])
+
+    # Detach the loop device or the NBD device.
+
+    if is_nbd:
+        detaching_command = qcow2_overlay.create_nbd_disconnect_command(
+            loopback_device_file)
+    else:
+        detaching_command = ['losetup', '-d', loopback_device_file]
+
+    total_seconds += call_with_time(u'detach', detaching_command)
+
+    print 'total : %.3f s' % total_seconds
 
 
 def create_command_line_parser():
@@ -50,6 +100,18 @@ def create_command_line_parser():
         description=
         u'Unmount the root filesystem in an image of Raspberry Pi.')
 
+    parser.add_argument(
+        '-p', '--profile', dest='profile_name',
+        choices=mount_profiles.PROFILE_NAMES, default=None,
+        help=u'Profile that is used at mounting.')
+    parser.add_argument(
+        '--nbd', dest='is_nbd', action='store_true', default=False,
+        help=u'LOOPBACK_DEVICE_FILE is an NBD device.')
+    parser.add_argument(
+        '--metrics', dest='metrics_textfile', default=None,
+        metavar='TEXTFILE',
+        help=u'Textfile of the Prometheus node exporter to record metrics.')
+
     parser.add_argument(
         'loopback_device_file', metavar='LOOPBACK_DEVICE_FILE', nargs='?')
     parser.add_argument(
@@ -68,7 +130,12 @@ if __name__ == '__main__':
     # If there is not arguments, print help and exit.
 
     if arguments.loopback_device_file and arguments.mount_point:
-        main(arguments.loopback_device_file, arguments.mount_point)
+        metrics.configure(arguments.metrics_textfile, u'umount')
+        try:
+            main(arguments.loopback_device_file, arguments.mount_point,
+                 arguments.profile_name, arguments.is_nbd)
+        finally:
+            metrics.write()
     else:
         parser.print_help()
         sys.exit(1)
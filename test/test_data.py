@@ -27,3 +27,6 @@ import os.path
 
 FDISK_OUTPUT_FILE = os.path.join(
     os.path.dirname(__file__), u'fdisk_output.txt')
+
+FDISK_OUTPUT_WITH_LOGICAL_PARTITIONS_FILE = os.path.join(
+    os.path.dirname(__file__), u'fdisk_output_logical.txt')
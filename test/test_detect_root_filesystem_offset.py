@@ -42,6 +42,17 @@ class TestDetectRootFilesystem(unittest.TestCase):
 
         self.assertEqual(512 * 122880, offset)
 
+    def testLogicalPartition(self):
+        u'''
+        Test that the offset of a root filesystem in a logical partition is
+        detected.
+        '''
+        with open(test_data.FDISK_OUTPUT_WITH_LOGICAL_PARTITIONS_FILE) as f:
+            offset = mount_raspberry_pi_image_rootfs.\
+                detect_root_filesystem_offset(f.read())
+
+        self.assertEqual(512 * 1826816, offset)
+
     def testInvalidOutput(self):
         u'''
         Test that CannotDetectOffsetError raises when the output of fdisk is
@@ -0,0 +1,144 @@
+#!/usr/bin/env python
+
+# The MIT License (MIT)
+#
+# Copyright (c) 2013 Keita Kita
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in
+# all copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN
+# THE SOFTWARE.
+
+# This script tests creating commands to export the root filesystem.
+
+import os
+import os.path
+import shutil
+import tempfile
+import unittest
+
+import export_raspberry_pi_image_rootfs as export
+
+
+class TestDetectExportFormat(unittest.TestCase):
+    def testKnownExtensions(self):
+        u'''
+        Test that the format is detected from the extension.
+        '''
+        self.assertEqual(
+            export.SQUASHFS_FORMAT,
+            export.detect_export_format(u'rootfs.squashfs'))
+        self.assertEqual(
+            export.TAR_ZSTD_FORMAT,
+            export.detect_export_format(u'rootfs.tar.zst'))
+        self.assertEqual(
+            export.TAR_GZIP_FORMAT, export.detect_export_format(u'rootfs.tgz'))
+
+    def testUnknownExtension(self):
+        u'''
+        Test that None is returned when the extension is unknown.
+        '''
+        self.assertIsNone(export.detect_export_format(u'rootfs.img'))
+
+
+class TestCreateExportCommands(unittest.TestCase):
+    def testTarCommands(self):
+        u'''
+        Test that tar preserving attributes is piped to a parallel compressor.
+        '''
+        (tar_command, compress_command) = export.create_export_commands(
+            export.TAR_XZ_FORMAT, u'/mnt', 4)
+
+        self.assertEqual('tar', tar_command[0])
+        self.assertIn('--numeric-owner', tar_command)
+        self.assertIn('--xattrs', tar_command)
+        self.assertEqual(['xz', '-c', '-T4'], compress_command)
+
+    def testSquashfsCommand(self):
+        u'''
+        Test that squashfs is written by mksquashfs itself.
+        '''
+        self.assertEqual(
+            [], export.create_export_commands(
+                export.SQUASHFS_FORMAT, u'/mnt', 4))
+        self.assertEqual(
+            ['mksquashfs', u'/mnt', u'rootfs.sqfs', '-noappend',
+                '-one-file-system', '-processors', '4'],
+            export.create_squashfs_command(u'/mnt', u'rootfs.sqfs', 4))
+
+
+class TestFormatThroughput(unittest.TestCase):
+    def testFormatThroughput(self):
+        u'''
+        Test that the throughput is calculated from the input bytes.
+        '''
+        self.assertEqual(
+            u'100.0 MiB -> 40.0 MiB in 2.0 s (50.0 MiB/s)',
+            export.format_throughput(100 * 1024 ** 2, 40 * 1024 ** 2, 2.0))
+
+
+class TestFindMountPoint(unittest.TestCase):
+    def setUp(self):
+        self.__directory = tempfile.mkdtemp()
+        self.__mounts_file = os.path.join(self.__directory, u'mounts')
+        with open(self.__mounts_file, 'w') as f:
+            f.write('/dev/sda1 / ext4 rw 0 0\n')
+            f.write('/dev/loop1 /mnt/rasp\\040pi ext4 rw 0 0\n')
+            f.write('/dev/loop3 /mnt/part ext4 rw 0 0\n')
+
+        loop_directory = os.path.join(self.__directory, u'loop1', u'loop')
+        os.makedirs(loop_directory)
+        with open(os.path.join(loop_directory, u'backing_file'), 'w') as f:
+            f.write('/dev/loop0\n')
+        with open(os.path.join(loop_directory, u'offset'), 'w') as f:
+            f.write('62914560\n')
+
+    def tearDown(self):
+        shutil.rmtree(self.__directory)
+
+    def testParseMounts(self):
+        u'''
+        Test that escaped mount points are unescaped.
+        '''
+        self.assertEqual(
+            [('/dev/sda1', '/'), ('/dev/loop1', '/mnt/rasp pi')],
+            export.parse_mounts(
+                '/dev/sda1 / ext4 rw 0 0\n' +
+                '/dev/loop1 /mnt/rasp\\040pi ext4 rw 0 0\n'))
+
+    def testMountedThroughLoopDevice(self):
+        u'''
+        Test that a root filesystem mounted through a loop device at
+        the offset is found.
+        '''
+        self.assertEqual(
+            '/mnt/rasp pi',
+            export.find_mount_point(
+                u'/dev/loop0', 62914560, self.__mounts_file,
+                self.__directory))
+        self.assertIsNone(
+            export.find_mount_point(
+                u'/dev/loop0', 4194304, self.__mounts_file,
+                self.__directory))
+
+    def testMountedDirectly(self):
+        u'''
+        Test that a partition mounted directly is found.
+        '''
+        self.assertEqual(
+            '/mnt/part',
+            export.find_mount_point(
+                u'/dev/loop3', 0, self.__mounts_file, self.__directory))
@@ -0,0 +1,86 @@
+#!/usr/bin/env python
+
+# The MIT License (MIT)
+#
+# Copyright (c) 2013 Keita Kita
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in
+# all copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN
+# THE SOFTWARE.
+
+# This script tests ext4_superblock.py.
+
+import struct
+import unittest
+
+import ext4_superblock
+
+FILESYSTEM_UUID = u'0123abcd-0000-4000-8000-00000000cafe'
+
+
+def create_superblock(
+        blocks_count, free_blocks_count, feature_incompat=0,
+        blocks_count_hi=0, free_blocks_count_hi=0):
+    data = bytearray(ext4_superblock.SUPERBLOCK_SIZE)
+    struct.pack_into('<I', data, 0x04, blocks_count)
+    struct.pack_into('<I', data, 0x0c, free_blocks_count)
+    struct.pack_into('<I', data, 0x18, 2)
+    struct.pack_into('<H', data, 0x38, ext4_superblock.EXT4_MAGIC)
+    struct.pack_into('<I', data, 0x60, feature_incompat)
+    data[0x68:0x78] = '0123abcd00004000800000000000cafe'.decode('hex')
+    data[0x78:0x7e] = 'rootfs'
+    struct.pack_into('<I', data, 0x150, blocks_count_hi)
+    struct.pack_into('<I', data, 0x158, free_blocks_count_hi)
+    return str(data)
+
+
+class TestParseSuperblock(unittest.TestCase):
+    def testParseSuperblock(self):
+        u'''
+        Test whether values are read from the superblock.
+        '''
+        superblock = ext4_superblock.parse_superblock(
+            create_superblock(1000, 400))
+
+        self.assertEqual(4096, superblock.block_size)
+        self.assertEqual(1000, superblock.blocks_count)
+        self.assertEqual(600, superblock.used_blocks_count)
+        self.assertEqual(600 * 4096, superblock.used_bytes)
+        self.assertEqual(FILESYSTEM_UUID, superblock.uuid)
+        self.assertEqual(u'rootfs', superblock.label)
+
+    def test64BitCounts(self):
+        u'''
+        Test that high bits of counts are used only in 64bit filesystems.
+        '''
+        data = create_superblock(1000, 400, 0, 1, 1)
+        self.assertEqual(
+            1000, ext4_superblock.parse_superblock(data).blocks_count)
+
+        data = create_superblock(
+            1000, 400, ext4_superblock.INCOMPAT_64BIT, 1, 1)
+        self.assertEqual(
+            (1 << 32) + 1000,
+            ext4_superblock.parse_superblock(data).blocks_count)
+
+    def testInvalidSuperblock(self):
+        u'''
+        Test whether an exception is raised when the magic is invalid.
+        '''
+        with self.assertRaises(ext4_superblock.InvalidSuperblockError):
+            ext4_superblock.parse_superblock(
+                '\x00' * ext4_superblock.SUPERBLOCK_SIZE)
@@ -65,6 +65,22 @@ class TestDetectingPartitions(unittest.TestCase):
         self.assertEqual(end_unit_index, partition.end_unit_index)
         self.assertEqual(system, partition.system)
 
+    def testDetectingLogicalPartitions(self):
+        u'''
+        Test whether logical partitions and their numbers are detected.
+        '''
+        with open(test_data.FDISK_OUTPUT_WITH_LOGICAL_PARTITIONS_FILE) as f:
+            partitions = fdisk_output_parser.detect_partitions(f.read())
+
+        self.assertEqual(4, len(partitions))
+        self.assertEqual(
+            [1, 2, 5, 6], [partition.number for partition in partitions])
+        self.assertTrue(partitions[1].is_extended)
+        self.assertFalse(partitions[3].is_extended)
+        self.assertPartition(
+            512, 1695744, 1818624, u'W95 FAT32 (LBA)', partitions[2])
+        self.assertPartition(512, 1826816, 7744511, u'Linux', partitions[3])
+
     def testInvalidFdiskOutput(self):
         u'''
         Test whether an exception is raised when the output of
@@ -0,0 +1,77 @@
+#!/usr/bin/env python
+
+# The MIT License (MIT)
+#
+# Copyright (c) 2013 Keita Kita
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in
+# all copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN
+# THE SOFTWARE.
+
+# This script tests finding loop devices that an image is attached to.
+
+import os
+import os.path
+import shutil
+import tempfile
+import unittest
+
+import resize_raspberry_pi_image_rootfs
+
+
+class TestFindLoopDevicesOver(unittest.TestCase):
+    def setUp(self):
+        self.__directory = tempfile.mkdtemp()
+        self.__image_file = os.path.join(self.__directory, u'rasp.img')
+
+    def tearDown(self):
+        shutil.rmtree(self.__directory)
+
+    def createLoopDevice(self, name, backing_file=None, offset=0):
+        loop_directory = os.path.join(self.__directory, name, u'loop')
+        os.makedirs(loop_directory)
+        if backing_file is not None:
+            with open(os.path.join(loop_directory, u'backing_file'),
+                      'w') as f:
+                f.write(backing_file + '\n')
+            with open(os.path.join(loop_directory, u'offset'), 'w') as f:
+                f.write('%d\n' % offset)
+
+    def testImageInUse(self):
+        u'''
+        Test that loop devices over the image and over such loop devices are
+        found.
+        '''
+        self.createLoopDevice(u'loop0', self.__image_file)
+        self.createLoopDevice(u'loop1', u'/dev/loop0', 62914560)
+        self.createLoopDevice(u'loop2', u'/tmp/other.img')
+        self.createLoopDevice(u'loop3')
+
+        self.assertEqual(
+            [u'/dev/loop0', u'/dev/loop1'],
+            resize_raspberry_pi_image_rootfs.find_loop_devices_over(
+                self.__image_file, self.__directory))
+
+    def testImageNotInUse(self):
+        u'''
+        Test that no loop device is found when the image is not attached.
+        '''
+        self.createLoopDevice(u'loop0', u'/tmp/other.img')
+
+        self.assertEqual(
+            [], resize_raspberry_pi_image_rootfs.find_loop_devices_over(
+                self.__image_file, self.__directory))
@@ -0,0 +1,189 @@
+#!/usr/bin/env python
+
+# The MIT License (MIT)
+#
+# Copyright (c) 2013 Keita Kita
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in
+# all copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN
+# THE SOFTWARE.
+
+# This script tests inventory_images.py.
+
+import os
+import os.path
+import shutil
+import tempfile
+import unittest
+
+import ext4_superblock
+import fdisk_output_parser
+import inventory_images
+import test_data
+import test_ext4_superblock
+
+# The offset of the root filesystem in FDISK_OUTPUT_WITH_LOGICAL_PARTITIONS.
+
+ROOT_FILESYSTEM_OFFSET = 1826816 * 512
+
+
+def create_image_file(image_file):
+    u'''
+    Create a sparse image file that has a root filesystem in a logical
+    partition.
+    '''
+    with open(image_file, 'wb') as f:
+        f.seek(ROOT_FILESYSTEM_OFFSET + ext4_superblock.SUPERBLOCK_OFFSET)
+        f.write(test_ext4_superblock.create_superblock(1000, 400))
+
+
+class TestParseOsRelease(unittest.TestCase):
+    def testParseOsRelease(self):
+        u'''
+        Test that quoted and unquoted values are parsed.
+        '''
+        values = inventory_images.parse_os_release(
+            u'# comment\n' +
+            u'PRETTY_NAME="Raspbian GNU/Linux 7 (wheezy)"\n' +
+            u'ID=raspbian\n' +
+            u'\n')
+
+        self.assertEqual(
+            {u'PRETTY_NAME': u'Raspbian GNU/Linux 7 (wheezy)',
+             u'ID': u'raspbian'},
+            values)
+
+
+class TestDescribeImage(unittest.TestCase):
+    def setUp(self):
+        fd, self.__image_file = tempfile.mkstemp()
+        os.close(fd)
+        create_image_file(self.__image_file)
+
+        with open(test_data.FDISK_OUTPUT_WITH_LOGICAL_PARTITIONS_FILE) as f:
+            self.__partitions = fdisk_output_parser.detect_partitions(
+                f.read())
+
+    def tearDown(self):
+        os.remove(self.__image_file)
+
+    def testDescribeImage(self):
+        u'''
+        Test that the root filesystem in a logical partition is described,
+        and the extended partition is not listed.
+        '''
+        entry = {}
+        inventory_images.describe_image(
+            entry, self.__image_file, self.__partitions)
+
+        self.assertNotIn(u'error', entry)
+        self.assertEqual(
+            [(1, u'W95 FAT16 (LBA)'), (5, u'W95 FAT32 (LBA)'), (6, u'Linux')],
+            [(partition[u'number'], partition[u'system'])
+             for partition in entry[u'partitions']])
+        self.assertEqual(
+            ROOT_FILESYSTEM_OFFSET, entry[u'root_filesystem_offset'])
+        self.assertEqual(test_ext4_superblock.FILESYSTEM_UUID, entry[u'uuid'])
+        self.assertEqual(600 * 4096, entry[u'used_bytes'])
+
+    def testRootFilesystemIsNotFound(self):
+        u'''
+        Test that an image without Linux partition has an error.
+        '''
+        entry = {}
+        inventory_images.describe_image(
+            entry, self.__image_file, self.__partitions[:1])
+
+        self.assertIn(u'error', entry)
+
+
+class TestInventory(unittest.TestCase):
+    def setUp(self):
+        self.__directory = tempfile.mkdtemp()
+        os.mkdir(os.path.join(self.__directory, u'sub'))
+        create_image_file(os.path.join(self.__directory, u'sub', u'a.img'))
+
+    def tearDown(self):
+        shutil.rmtree(self.__directory)
+
+    def testRescanOnlyChangedImages(self):
+        u'''
+        Test that only new or changed images are scanned again.
+        '''
+        index, scanned_count = inventory_images.inventory(
+            self.__directory, {}, u'*.img', 2)
+        self.assertEqual(1, scanned_count)
+        self.assertIn(os.path.join(u'sub', u'a.img'), index)
+
+        index, scanned_count = inventory_images.inventory(
+            self.__directory, index, u'*.img', 2)
+        self.assertEqual(0, scanned_count)
+
+        create_image_file(os.path.join(self.__directory, u'b.img'))
+        index, scanned_count = inventory_images.inventory(
+            self.__directory, index, u'*.img', 2)
+        self.assertEqual(1, scanned_count)
+        self.assertEqual(2, len(index))
+
+    def testRescanOtherVersion(self):
+        u'''
+        Test that an entry of another version is scanned again.
+        '''
+        index, _ = inventory_images.inventory(
+            self.__directory, {}, u'*.img', 2)
+        for entry in index.itervalues():
+            entry[u'version'] = inventory_images.ENTRY_VERSION - 1
+
+        _, scanned_count = inventory_images.inventory(
+            self.__directory, index, u'*.img', 2)
+        self.assertEqual(1, scanned_count)
+
+    def testInvalidImage(self):
+        u'''
+        Test that an image without partition table has an error.
+        '''
+        with open(os.path.join(self.__directory, u'empty.img'), 'wb') as f:
+            f.write('\x00' * 512)
+
+        index, _ = inventory_images.inventory(
+            self.__directory, {}, u'*.img', 2)
+
+        self.assertIn(u'error', index[u'empty.img'])
+
+    def testNonAsciiPath(self):
+        u'''
+        Test that a non-ASCII path is reused from a saved index and is
+        written to CSV.
+        '''
+        create_image_file(
+            os.path.join(self.__directory, u'caf\u00e9.img').encode('utf-8'))
+        index_file = os.path.join(self.__directory, u'index.json')
+        csv_file = os.path.join(self.__directory, u'index.csv')
+
+        index, _ = inventory_images.inventory(
+            self.__directory.encode('utf-8'), {}, u'*.img', 2)
+        inventory_images.save_index(index_file, index)
+
+        index, scanned_count = inventory_images.inventory(
+            self.__directory.encode('utf-8'),
+            inventory_images.load_index(index_file), u'*.img', 2)
+        self.assertEqual(0, scanned_count)
+        self.assertIn(u'caf\u00e9.img', index)
+
+        inventory_images.save_csv(csv_file, index)
+        with open(csv_file) as f:
+            self.assertIn(u'caf\u00e9.img'.encode('utf-8'), f.read())
@@ -0,0 +1,112 @@
+#!/usr/bin/env python
+
+# The MIT License (MIT)
+#
+# Copyright (c) 2013 Keita Kita
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in
+# all copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN
+# THE SOFTWARE.
+
+# This script tests mbr_partition_table.py.
+
+import struct
+import unittest
+
+import mbr_partition_table
+
+
+def create_mbr(entries):
+    u'''
+    Create a Master Boot Record that contains partition entries.
+
+    Argument:
+        entries : A list of tuples of (type, start sector, sectors count).
+    Return:
+        A string of the Master Boot Record.
+    '''
+    mbr = '\x00' * mbr_partition_table.PARTITION_TABLE_OFFSET
+    for partition_type, start_sector, sectors_count in entries:
+        mbr += struct.pack(
+            '<B3sB3sII', 0, '\x00\x00\x00', partition_type, '\x00\x00\x00',
+            start_sector, sectors_count)
+    mbr += '\x00' * (mbr_partition_table.SIGNATURE_OFFSET - len(mbr))
+    return mbr + mbr_partition_table.SIGNATURE
+
+
+class TestReadingPartitionEntries(unittest.TestCase):
+    def setUp(self):
+        self.__mbr = create_mbr(
+            [(0x0c, 8192, 114688), (0x83, 122880, 3665920)])
+
+    def testReadPartitionEntries(self):
+        u'''
+        Test whether the partition entries are read.
+        '''
+        entries = mbr_partition_table.read_partition_entries(self.__mbr)
+
+        self.assertEqual(2, len(entries))
+        self.assertEqual(1, entries[1].index)
+        self.assertEqual(0x83, entries[1].partition_type)
+        self.assertEqual(122880, entries[1].start_sector)
+        self.assertEqual(3665920, entries[1].sectors_count)
+        self.assertEqual(512 * 122880, entries[1].start_offset_bytes)
+
+    def testFindPartitionEntry(self):
+        u'''
+        Test whether the partition entry is found by its offset.
+        '''
+        entry = mbr_partition_table.find_partition_entry(
+            self.__mbr, 512 * 122880)
+
+        self.assertEqual(1, entry.index)
+        self.assertIsNone(
+            mbr_partition_table.find_partition_entry(self.__mbr, 512))
+
+    def testInvalidMbr(self):
+        u'''
+        Test whether an exception is raised when the signature is invalid.
+        '''
+        with self.assertRaises(mbr_partition_table.InvalidMbrError):
+            mbr_partition_table.read_partition_entries('\x00' * 512)
+
+
+class TestResizingPartitionEntry(unittest.TestCase):
+    def testResizePartitionEntry(self):
+        u'''
+        Test whether only the length of the partition entry is rewritten.
+        '''
+        mbr = create_mbr([(0x0c, 8192, 114688), (0x83, 122880, 3665920)])
+
+        resized_mbr = mbr_partition_table.resize_partition_entry(
+            mbr, 1, 7000000)
+        entries = mbr_partition_table.read_partition_entries(resized_mbr)
+
+        self.assertEqual(len(mbr), len(resized_mbr))
+        self.assertEqual(114688, entries[0].sectors_count)
+        self.assertEqual(122880, entries[1].start_sector)
+        self.assertEqual(7000000, entries[1].sectors_count)
+
+    def testTooManySectors(self):
+        u'''
+        Test that ValueError raises when the count is out of 32 bits.
+        '''
+        mbr = create_mbr([(0x83, 122880, 3665920)])
+
+        with self.assertRaises(ValueError):
+            mbr_partition_table.resize_partition_entry(
+                mbr, 0, mbr_partition_table.MAXIMUM_SECTORS_COUNT + 1)
@@ -0,0 +1,183 @@
+#!/usr/bin/env python
+
+# The MIT License (MIT)
+#
+# Copyright (c) 2013 Keita Kita
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in
+# all copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN
+# THE SOFTWARE.
+
+# This script tests metrics.py.
+
+import os
+import os.path
+import shutil
+import tempfile
+import unittest
+
+import metrics
+
+
+class TestMergeMetrics(unittest.TestCase):
+    def testMergeLatencies(self):
+        u'''
+        Test that a latency is counted in every bucket that it fits.
+        '''
+        state = {}
+        metrics.merge_metrics(
+            state, u'mount', [(u'attach', 0.2), (u'attach', 20.0)], [])
+
+        histogram = state[u'histograms'][u'mount/attach']
+        self.assertEqual(2, histogram[u'count'])
+        self.assertAlmostEqual(20.2, histogram[u'sum'])
+        self.assertEqual(
+            1, histogram[u'buckets'][metrics.LATENCY_BUCKETS.index(0.25)])
+        self.assertEqual(
+            2, histogram[u'buckets'][metrics.LATENCY_BUCKETS.index(30.0)])
+
+    def testMergeFailures(self):
+        u'''
+        Test that failures are accumulated by step.
+        '''
+        state = {u'failures': {u'mount/detach_cleanup': 1}}
+        metrics.merge_metrics(
+            state, u'mount', [], [u'detach_cleanup', u'mount'])
+
+        self.assertEqual(
+            {u'mount/detach_cleanup': 2, u'mount/mount': 1},
+            state[u'failures'])
+
+
+class TestRenderTextfile(unittest.TestCase):
+    def testRenderTextfile(self):
+        u'''
+        Test that metrics are rendered in the exposition format.
+        '''
+        state = {}
+        metrics.merge_metrics(
+            state, u'umount', [(u'sync', 1.5)], [u'detach'])
+
+        lines = metrics.render_textfile(state, (3, 1)).splitlines()
+
+        self.assertIn(
+            u'raspberry_pi_image_phase_seconds_bucket' +
+            u'{script="umount",phase="sync",le="2.5"} 1', lines)
+        self.assertIn(
+            u'raspberry_pi_image_phase_seconds_bucket' +
+            u'{script="umount",phase="sync",le="+Inf"} 1', lines)
+        self.assertIn(
+            u'raspberry_pi_image_failures_total' +
+            u'{script="umount",step="detach"} 1', lines)
+        self.assertIn(
+            u'raspberry_pi_image_loop_devices{state="orphaned"} 1', lines)
+
+
+class TestCountLoopDevices(unittest.TestCase):
+    def setUp(self):
+        self.__directory = tempfile.mkdtemp()
+        self.__mounts_file = os.path.join(self.__directory, u'mounts')
+        with open(self.__mounts_file, 'w') as f:
+            f.write('/dev/loop0p2 /mnt ext4 rw 0 0\n')
+
+    def tearDown(self):
+        shutil.rmtree(self.__directory)
+
+    def createLoopDevice(self, name, backing_file=None, holders=[]):
+        os.makedirs(os.path.join(self.__directory, name, u'loop'))
+        os.makedirs(os.path.join(self.__directory, name, u'holders'))
+        for holder in holders:
+            os.makedirs(os.path.join(
+                self.__directory, name, u'holders', holder))
+        if backing_file is not None:
+            with open(os.path.join(
+                    self.__directory, name, u'loop', u'backing_file'),
+                    'w') as f:
+                f.write(backing_file + '\n')
+
+    def testCountLoopDevices(self):
+        u'''
+        Test that loop devices with deleted backing files or without users
+        are orphaned.
+        '''
+        self.createLoopDevice(u'loop0', self.__directory)
+        self.createLoopDevice(u'loop1', u'/tmp/a.img (deleted)')
+        self.createLoopDevice(u'loop2')
+        self.createLoopDevice(u'loop3', self.__directory, [u'dm-0'])
+        self.createLoopDevice(u'loop4', self.__directory)
+        os.makedirs(os.path.join(self.__directory, u'sda'))
+
+        self.assertEqual(
+            (4, 2), metrics.count_loop_devices(
+                self.__directory, self.__mounts_file))
+
+    def testLoopDeviceOverLoopDevice(self):
+        u'''
+        Test that a loop device that backs another loop device is used.
+        '''
+        self.createLoopDevice(u'loop0', self.__directory)
+        self.createLoopDevice(u'loop1', self.__directory)
+        self.createLoopDevice(u'loop2', u'/dev/loop1')
+
+        # loop2 itself is not used by anything.
+        self.assertEqual(
+            (3, 1), metrics.count_loop_devices(
+                self.__directory, self.__mounts_file))
+
+
+class TestMetricsRecorder(unittest.TestCase):
+    def setUp(self):
+        self.__directory = tempfile.mkdtemp()
+        self.__textfile = os.path.join(self.__directory, u'metrics.prom')
+
+    def tearDown(self):
+        shutil.rmtree(self.__directory)
+
+    def testPhaseCountsFailure(self):
+        u'''
+        Test that a phase that exits with an error is counted as a failure.
+        '''
+        recorder = metrics.MetricsRecorder(self.__textfile, u'mount')
+        with self.assertRaises(SystemExit):
+            with recorder.phase(u'mount'):
+                raise SystemExit(1)
+
+        recorder.write(self.__directory)
+
+        with open(self.__textfile) as f:
+            lines = f.read().splitlines()
+        self.assertIn(
+            u'raspberry_pi_image_failures_total' +
+            u'{script="mount",step="mount"} 1', lines)
+        self.assertIn(
+            u'raspberry_pi_image_phase_seconds_count' +
+            u'{script="mount",phase="mount"} 1', lines)
+
+    def testMetricsAreAccumulated(self):
+        u'''
+        Test that metrics of runs are accumulated in the state file.
+        '''
+        for _ in range(2):
+            recorder = metrics.MetricsRecorder(self.__textfile, u'umount')
+            recorder.observe(u'umount', 0.5)
+            recorder.write(self.__directory)
+
+        with open(self.__textfile) as f:
+            lines = f.read().splitlines()
+        self.assertIn(
+            u'raspberry_pi_image_phase_seconds_count' +
+            u'{script="umount",phase="umount"} 2', lines)
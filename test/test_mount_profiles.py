@@ -0,0 +1,66 @@
+#!/usr/bin/env python
+
+# The MIT License (MIT)
+#
+# Copyright (c) 2013 Keita Kita
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in
+# all copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN
+# THE SOFTWARE.
+
+# This script tests mount_profiles.py.
+
+import unittest
+
+import mount_profiles
+
+
+class TestCreateMountOptions(unittest.TestCase):
+    def testWithoutProfile(self):
+        u'''
+        Test that only the loop device and the offset are specified without
+        a profile.
+        '''
+        self.assertEqual(
+            u'loop,offset=1024',
+            mount_profiles.create_mount_options(None, 1024))
+
+    def testBuildProfile(self):
+        u'''
+        Test that options of the build profile follow the offset.
+        '''
+        profile = mount_profiles.get_profile(mount_profiles.BUILD_PROFILE)
+
+        self.assertEqual(
+            u'loop,offset=1024,noatime,commit=60,nobarrier,data=writeback',
+            mount_profiles.create_mount_options(profile, 1024))
+        self.assertFalse(profile.syncs_before_unmount)
+
+    def testShipProfile(self):
+        u'''
+        Test that the ship profile syncs before unmounting.
+        '''
+        profile = mount_profiles.get_profile(mount_profiles.SHIP_PROFILE)
+
+        self.assertTrue(profile.syncs_before_unmount)
+
+    def testUnknownProfile(self):
+        u'''
+        Test that KeyError raises when the profile is unknown.
+        '''
+        with self.assertRaises(KeyError):
+            mount_profiles.get_profile(u'unknown')
@@ -0,0 +1,67 @@
+#!/usr/bin/env python
+
+# The MIT License (MIT)
+#
+# Copyright (c) 2013 Keita Kita
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in
+# all copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN
+# THE SOFTWARE.
+
+# This script tests parsing a size of an image to resize.
+
+import unittest
+
+import resize_raspberry_pi_image_rootfs
+
+
+class TestParseImageSize(unittest.TestCase):
+    def testAbsoluteSize(self):
+        u'''
+        Test that a size with a unit is converted to bytes.
+        '''
+        self.assertEqual(
+            4 * 1024 ** 3,
+            resize_raspberry_pi_image_rootfs.parse_image_size(u'4G', 0))
+
+    def testRelativeSize(self):
+        u'''
+        Test that a size with a sign is relative to the current size.
+        '''
+        self.assertEqual(
+            3 * 1024 ** 2,
+            resize_raspberry_pi_image_rootfs.parse_image_size(
+                u'+1m', 2 * 1024 ** 2))
+        self.assertEqual(
+            1024 ** 2,
+            resize_raspberry_pi_image_rootfs.parse_image_size(
+                u'-1M', 2 * 1024 ** 2))
+
+    def testSizeIsRoundedToSector(self):
+        u'''
+        Test that a size is rounded down to the size of a sector.
+        '''
+        self.assertEqual(
+            1024,
+            resize_raspberry_pi_image_rootfs.parse_image_size(u'1500', 0))
+
+    def testInvalidSize(self):
+        u'''
+        Test that ValueError raises when the size is invalid.
+        '''
+        with self.assertRaises(ValueError):
+            resize_raspberry_pi_image_rootfs.parse_image_size(u'4GB', 0)
@@ -0,0 +1,151 @@
+#!/usr/bin/env python
+
+# The MIT License (MIT)
+#
+# Copyright (c) 2013 Keita Kita
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in
+# all copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN
+# THE SOFTWARE.
+
+# This script tests partition_filesystem.py.
+
+import errno
+import os
+import stat
+import tempfile
+import unittest
+
+import fdisk_output_parser
+import partition_filesystem
+import test_data
+
+
+class TestListPartitionFiles(unittest.TestCase):
+    def testNamedAfterPartitionNumbers(self):
+        u'''
+        Test that files are named after partition numbers, and extended
+        partitions are not listed.
+        '''
+        with open(test_data.FDISK_OUTPUT_WITH_LOGICAL_PARTITIONS_FILE) as f:
+            partitions = fdisk_output_parser.detect_partitions(f.read())
+
+        self.assertEqual(
+            [u'p1', u'p5', u'p6'],
+            [name for name, _ in
+             partition_filesystem.list_partition_files(partitions)])
+
+    def testEmptyPrimarySlot(self):
+        u'''
+        Test that a number is kept when a primary slot before it is empty.
+        '''
+        partitions = [
+            fdisk_output_parser.Partition(
+                512, 8192, 122879, u'W95 FAT32 (LBA)', u'a.img2'),
+            fdisk_output_parser.Partition(
+                512, 122880, 3788799, u'Extended', u'a.img3')]
+
+        self.assertEqual(
+            [u'p2'],
+            [name for name, _ in
+             partition_filesystem.list_partition_files(partitions)])
+
+
+class TestPartitionFilesystem(unittest.TestCase):
+    def setUp(self):
+        fd, self.__image_file = tempfile.mkstemp()
+        os.write(fd, 'a' * 1024 + 'b' * 1024 + 'c' * 2048)
+        os.close(fd)
+
+        self.__partitions = [
+            fdisk_output_parser.Partition(
+                512, 2, 3, u'W95 FAT32 (LBA)', u'/dev/loop0p1'),
+            fdisk_output_parser.Partition(
+                512, 4, 7, u'Linux', u'/dev/loop0p2')]
+
+    def tearDown(self):
+        os.remove(self.__image_file)
+
+    def createFilesystem(self, read_only=False):
+        return partition_filesystem.PartitionFilesystem(
+            self.__image_file, self.__partitions, read_only)
+
+    def testAttributes(self):
+        u'''
+        Test that partitions are regular files that have their sizes.
+        '''
+        target = self.createFilesystem()
+
+        self.assertEqual(
+            [u'.', u'..', u'p1', u'p2'], target('readdir', u'/', None))
+        self.assertTrue(stat.S_ISDIR(target('getattr', u'/')['st_mode']))
+        attributes = target('getattr', u'/p2')
+        self.assertTrue(stat.S_ISREG(attributes['st_mode']))
+        self.assertEqual(2048, attributes['st_size'])
+
+    def testUnknownPath(self):
+        u'''
+        Test that ENOENT is raised for a path that is not a partition.
+        '''
+        with self.assertRaises(OSError) as context:
+            self.createFilesystem()('getattr', u'/p3')
+        self.assertEqual(errno.ENOENT, context.exception.errno)
+
+    def testRead(self):
+        u'''
+        Test that reading starts at the partition and stops at its end.
+        '''
+        target = self.createFilesystem()
+        fh = target('open', u'/p1', os.O_RDONLY)
+        try:
+            self.assertEqual('b' * 16, target('read', u'/p1', 16, 0, fh))
+            self.assertEqual(
+                'b' * 24, target('read', u'/p1', 4096, 1000, fh))
+            self.assertEqual('', target('read', u'/p1', 16, 1024, fh))
+        finally:
+            target('release', u'/p1', fh)
+
+    def testWrite(self):
+        u'''
+        Test that writing is passed through to the image at the partition.
+        '''
+        target = self.createFilesystem()
+        fh = target('open', u'/p2', os.O_RDWR)
+        try:
+            self.assertEqual(2, target('write', u'/p2', 'dddd', 2046, fh))
+        finally:
+            target('release', u'/p2', fh)
+
+        with open(self.__image_file, 'rb') as f:
+            self.assertEqual('c' * 2046 + 'dd', f.read()[2048:])
+
+    def testReadOnly(self):
+        u'''
+        Test that EROFS is raised when a read only partition is opened to
+        write.
+        '''
+        with self.assertRaises(OSError) as context:
+            self.createFilesystem(True)('open', u'/p1', os.O_WRONLY)
+        self.assertEqual(errno.EROFS, context.exception.errno)
+
+    def testUnsupportedOperation(self):
+        u'''
+        Test that ENOSYS is raised for an unsupported operation.
+        '''
+        with self.assertRaises(OSError) as context:
+            self.createFilesystem()('mkdir', u'/d', 0755)
+        self.assertEqual(errno.ENOSYS, context.exception.errno)
@@ -0,0 +1,128 @@
+#!/usr/bin/env python
+
+# The MIT License (MIT)
+#
+# Copyright (c) 2013 Keita Kita
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in
+# all copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN
+# THE SOFTWARE.
+
+# This script tests prefetch_profile.py.
+
+import os
+import shutil
+import tempfile
+import unittest
+
+import prefetch_profile
+
+FILEFRAG_OUTPUT = u'''Filesystem type is: ef53
+File size of /mnt/var/lib/dpkg/status is 1339011 (327 blocks of 4096 bytes)
+ ext:     logical_offset:        physical_offset: length:   expected: flags:
+   0:        0..     254:     166912..    167166:    255:
+   1:      255..     326:     170000..    170071:     72:     167167: last,eof
+/mnt/var/lib/dpkg/status: 2 extents found
+'''
+
+
+class TestParseFilefragOutput(unittest.TestCase):
+    def testParseFilefragOutput(self):
+        u'''
+        Test that extents are converted to ranges in bytes.
+        '''
+        self.assertEqual(
+            [(166912 * 4096, 255 * 4096), (170000 * 4096, 72 * 4096)],
+            prefetch_profile.parse_filefrag_output(FILEFRAG_OUTPUT))
+
+    def testInvalidOutput(self):
+        u'''
+        Test that no range is detected when the output is invalid.
+        '''
+        self.assertEqual([], prefetch_profile.parse_filefrag_output(u''))
+
+
+class TestRanges(unittest.TestCase):
+    def testMergeRanges(self):
+        u'''
+        Test that overlapping or adjacent ranges are merged.
+        '''
+        self.assertEqual(
+            [(0, 300), (400, 10)],
+            prefetch_profile.merge_ranges(
+                [(400, 10), (100, 200), (0, 100), (50, 10)]))
+
+    def testReadAheadSectors(self):
+        u'''
+        Test that read-ahead covers the longest range within bounds.
+        '''
+        self.assertEqual(
+            1024,
+            prefetch_profile.calculate_read_ahead_sectors(
+                [(0, 4096), (8192, 512 * 1024)]))
+        self.assertEqual(
+            prefetch_profile.MINIMUM_READ_AHEAD_SECTORS,
+            prefetch_profile.calculate_read_ahead_sectors([]))
+        self.assertEqual(
+            prefetch_profile.MAXIMUM_READ_AHEAD_SECTORS,
+            prefetch_profile.calculate_read_ahead_sectors(
+                [(0, 1024 ** 3)]))
+
+    def testWriteAndReadProfile(self):
+        u'''
+        Test that a written profile is read.
+        '''
+        fd, profile_file = tempfile.mkstemp()
+        os.close(fd)
+        try:
+            prefetch_profile.write_profile(
+                profile_file, [(4096, 8192), (1 << 33, 4096)])
+
+            self.assertEqual(
+                [(4096, 8192), (1 << 33, 4096)],
+                prefetch_profile.read_profile(profile_file))
+        finally:
+            os.remove(profile_file)
+
+
+class TestFindHotFiles(unittest.TestCase):
+    def setUp(self):
+        self.__directory = tempfile.mkdtemp()
+        self.__mount_point = os.path.join(self.__directory, u'mnt')
+        outside_directory = os.path.join(self.__directory, u'host')
+
+        os.makedirs(os.path.join(self.__mount_point, u'lib'))
+        os.mkdir(outside_directory)
+        for directory in [
+                os.path.join(self.__mount_point, u'lib'), outside_directory]:
+            with open(os.path.join(directory, u'a.so'), 'w'):
+                pass
+        os.symlink(
+            outside_directory, os.path.join(self.__mount_point, u'host'))
+
+    def tearDown(self):
+        shutil.rmtree(self.__directory)
+
+    def testSkipFilesOutsideOfMountPoint(self):
+        u'''
+        Test that files under a symbolic link to a directory outside of
+        the mount point are skipped.
+        '''
+        self.assertEqual(
+            [os.path.join(self.__mount_point, u'lib', u'a.so')],
+            prefetch_profile.find_hot_files(
+                self.__mount_point, [u'lib/*.so', u'host/*.so']))
@@ -0,0 +1,104 @@
+#!/usr/bin/env python
+
+# The MIT License (MIT)
+#
+# Copyright (c) 2013 Keita Kita
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in
+# all copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN
+# THE SOFTWARE.
+
+# This script tests creating commands of qcow2_overlay.py.
+
+import errno
+import os
+import os.path
+import shutil
+import tempfile
+import unittest
+
+import qcow2_overlay
+
+
+class TestImageFormat(unittest.TestCase):
+    def setUp(self):
+        self.__directory = tempfile.mkdtemp()
+        self.__base_image_file = os.path.join(self.__directory, u'base.img')
+        with open(self.__base_image_file, 'wb') as f:
+            f.write('\x00' * 512)
+
+        # A qcow2 file whose name does not end with .qcow2.
+        self.__overlay_file = os.path.join(self.__directory, u'job.img')
+        with open(self.__overlay_file, 'wb') as f:
+            f.write(qcow2_overlay.QCOW2_MAGIC + '\x00\x00\x00\x03')
+
+    def tearDown(self):
+        shutil.rmtree(self.__directory)
+
+    def testDetectImageFormat(self):
+        u'''
+        Test that the format is detected from the magic bytes.
+        '''
+        self.assertEqual(
+            qcow2_overlay.QCOW2_FORMAT,
+            qcow2_overlay.detect_image_format(self.__overlay_file))
+        self.assertEqual(
+            qcow2_overlay.RAW_FORMAT,
+            qcow2_overlay.detect_image_format(self.__base_image_file))
+
+    def testCreateOverlayCommand(self):
+        u'''
+        Test that an overlay refers to the absolute path of its base.
+        '''
+        self.assertEqual(
+            ['qemu-img', 'create', '-f', 'qcow2',
+                '-b', self.__base_image_file, '-F', 'raw',
+                u'job.qcow2'],
+            qcow2_overlay.create_overlay_command(
+                os.path.relpath(self.__base_image_file), u'job.qcow2'))
+
+    def testNbdCommands(self):
+        u'''
+        Test that the format of the image is passed to qemu-nbd.
+        '''
+        self.assertEqual(
+            ['qemu-nbd', '--connect=/dev/nbd0', '--format=qcow2',
+                self.__overlay_file],
+            qcow2_overlay.create_nbd_connect_command(
+                u'/dev/nbd0', self.__overlay_file))
+        self.assertEqual(
+            ['qemu-nbd', '--disconnect', u'/dev/nbd0'],
+            qcow2_overlay.create_nbd_disconnect_command(u'/dev/nbd0'))
+
+
+class TestCreateOverlay(unittest.TestCase):
+    def testExistingOverlay(self):
+        u'''
+        Test that an existing overlay is not overwritten.
+        '''
+        fd, overlay_file = tempfile.mkstemp(suffix=u'.qcow2')
+        os.write(fd, 'changes')
+        os.close(fd)
+        try:
+            with self.assertRaises(OSError) as context:
+                qcow2_overlay.create_overlay(u'base.img', overlay_file)
+            self.assertEqual(errno.EEXIST, context.exception.errno)
+
+            with open(overlay_file) as f:
+                self.assertEqual('changes', f.read())
+        finally:
+            os.remove(overlay_file)